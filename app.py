@@ -1,17 +1,33 @@
-from flask import Flask, render_template, request, redirect, url_for, send_file, jsonify
-import sqlite3
+from flask import Flask, render_template, request, redirect, url_for, jsonify, Response, stream_with_context
+import multiprocessing
 import os
 import json
+import threading
+import time
 from datetime import datetime
 from werkzeug.utils import secure_filename
 
+import armazem
+import banco
+import cache_renders
+import entrega
+import fila
+import motor
+import previews
+import retencao
+from uploads import ArquivoComHash, RequestUpload
+
 app = Flask(__name__)
 app.secret_key = 'sistema-oab-secreto-2024'
-app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max
+# PSDs de impressão passam de 200MB; o upload é gravado em disco em blocos
+app.config['MAX_CONTENT_LENGTH'] = int(os.environ.get('OAB_MAX_UPLOAD_MB', '1024')) * 1024 * 1024
+app.request_class = RequestUpload
+# Apache/lighttpd enviam o arquivo a partir do cabeçalho X-Sendfile
+app.config['USE_X_SENDFILE'] = entrega.MODO_SENDFILE == 'x-sendfile'
 
 # Configurações
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-DB_PATH = os.path.join(BASE_DIR, 'database.db')
+DB_PATH = banco.DB_PATH
 
 # Criar pastas necessárias
 def criar_pastas():
@@ -19,7 +35,9 @@ def criar_pastas():
         'static/psd_base',
         'static/fotos', 
         'static/gerados',
+        'static/armazem',
         'static/previews',
+        'static/compilados',
         'static/css',
         'static/js',
         'templates'
@@ -27,11 +45,20 @@ def criar_pastas():
     for pasta in pastas:
         os.makedirs(pasta, exist_ok=True)
 
-criar_pastas()
+# Processos do motor (spawn) reimportam este módulo: só o processo web prepara pastas e banco
+PROCESSO_WEB = multiprocessing.parent_process() is None
+
+if PROCESSO_WEB:
+    criar_pastas()
+
+@app.template_global()
+def url_arquivo(nome, perfil=None):
+    """URL de exibição de um arquivo gerado (objeto do armazém ou nome antigo), opcionalmente em um perfil"""
+    return url_for('arquivo', nome=nome, perfil=perfil)
 
 # Inicializar banco de dados
 def init_db():
-    conn = sqlite3.connect(DB_PATH)
+    conn = banco.conectar(DB_PATH)
     c = conn.cursor()
     
     # Configuração do sistema
@@ -70,39 +97,143 @@ def init_db():
         )
     ''')
     
+    # Colunas adicionadas depois da criação original da tabela
+    c.execute("PRAGMA table_info(config)")
+    colunas = [row[1] for row in c.fetchall()]
+    for coluna, tipo_coluna in [('versao_frente', 'TEXT'), ('versao_verso', 'TEXT'), ('geracao', 'INTEGER DEFAULT 0'),
+                                ('espaco_area', 'TEXT')]:
+        if coluna not in colunas:
+            c.execute(f"ALTER TABLE config ADD COLUMN {coluna} {tipo_coluna}")
+    
+    # Índices, busca e contador do histórico
+    banco.criar_estruturas_historico(c)
+    
+    # Armazém endereçado por conteúdo (referências contadas a partir do histórico)
+    armazem.criar_tabela(c)
+    
+    # Cache de renderizações (depende do armazém e dos contadores)
+    cache_renders.criar_tabela(c)
+    
+    # Fila de gerações assíncronas
+    fila.criar_tabela(c)
+    
     # Inserir configuração padrão
     c.execute("INSERT OR IGNORE INTO config (id) VALUES (1)")
     
     conn.commit()
-    conn.close()
 
-init_db()
+def _recompilar_template(filepath, tipo, versao):
+    from psd_manager import compilar_template, hash_arquivo, versao_do_hash
+    
+    try:
+        # Só se o PSD em disco ainda é o dessa versão
+        if versao_do_hash(hash_arquivo(filepath)) == versao:
+            compilar_template(filepath, tipo, versao=versao)
+    except Exception as e:
+        print(f"Erro ao recompilar template {tipo}: {e}")
+
+# Templates compilados antes da composição parcial são refeitos em segundo plano por um só processo.
+# Até lá os outros renderizam com a compilação antiga, sem guardar no cache de renders
+def atualizar_templates():
+    from psd_manager import template_compilado_existe
+    
+    config = banco.obter_config()
+    for tipo in ('frente', 'verso'):
+        versao = config[f'versao_{tipo}']
+        filepath = os.path.join('static', 'psd_base', f'{tipo}.psd')
+        if not versao or template_compilado_existe(tipo, versao) or not os.path.exists(filepath):
+            continue
+        
+        # Reserva atômica entre os workers do servidor (refeita após 1 hora se quem reservou morreu)
+        nome = f'recompilar_{tipo}_{versao}'
+        agora = int(time.time())
+        with banco.conectar() as conn:
+            conn.execute("INSERT OR IGNORE INTO contadores (nome, valor) VALUES (?, 0)", (nome,))
+            reservado = conn.execute("UPDATE contadores SET valor = ? WHERE nome = ? AND valor <= ?",
+                                     (agora, nome, agora - 3600)).rowcount == 1
+        if reservado:
+            threading.Thread(target=_recompilar_template, args=(filepath, tipo, versao),
+                             name=f'recompilar-{tipo}', daemon=True).start()
+
+if PROCESSO_WEB:
+    init_db()
+    atualizar_templates()
+fila.iniciar(DB_PATH)
+retencao.iniciar(DB_PATH)
 
 # ============ ROTAS PRINCIPAIS ============
 
 @app.route('/')
 def index():
     """Página inicial"""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    
-    c.execute("SELECT psd_frente, psd_verso, area_foto FROM config WHERE id = 1")
-    config = c.fetchone()
-    
-    c.execute("SELECT COUNT(*) FROM historico")
-    total = c.fetchone()[0]
-    
-    c.execute("SELECT nome, rg, data FROM historico ORDER BY id DESC LIMIT 5")
-    historico = c.fetchall()
-    
-    conn.close()
+    config = banco.obter_config()
     
     return render_template('admin.html',
-                         frente=config[0] if config else None,
-                         verso=config[1] if config else None,
-                         area_foto=config[2] if config else None,
-                         total_geracoes=total,
-                         historico=historico)
+                         frente=config['psd_frente'],
+                         verso=config['psd_verso'],
+                         area_foto=config['area_foto'],
+                         total_geracoes=banco.total_historico(),
+                         historico=banco.ultimos_historico(5))
+
+@app.route('/historico')
+def historico():
+    """Histórico de gerações com busca e paginação"""
+    busca = request.args.get('q', '').strip()
+    antes = request.args.get('antes', type=int)
+    
+    linhas, proximo = banco.buscar_historico(busca, antes=antes)
+    
+    return render_template('historico.html',
+                         historico=linhas,
+                         busca=busca,
+                         proximo=proximo,
+                         total_geracoes=banco.total_historico())
+
+@app.route('/api/historico')
+def api_historico():
+    """Histórico em JSON (paginação por id: ?antes=<id>&limite=<n>&q=<texto>&rg=<rg>)"""
+    linhas, proximo = banco.buscar_historico(request.args.get('q'),
+                                             rg=request.args.get('rg'),
+                                             antes=request.args.get('antes', type=int),
+                                             limite=request.args.get('limite', banco.LIMITE_HISTORICO, type=int))
+    
+    return jsonify({'success': True, 'historico': linhas, 'proximo': proximo})
+
+@app.route('/api/pdf')
+def exportar_pdf():
+    """PDF de impressão (A4, vários cartões por folha, versos alinhados para duplex).
+    
+    Seleção: ?ids=1,2,3 ou os filtros do histórico (?q=<texto>&rg=<rg>).
+    Imposição: ?colunas=<n>&linhas=<n>&espacamento=<mm>&duplex=longa|curta
+    """
+    from impressao import COLUNAS, LINHAS, ESPACAMENTO_MM, gerar_pdf
+    
+    ids = [int(i) for i in request.args.get('ids', '').split(',') if i.strip().isdigit()]
+    geracoes = banco.historico_para_impressao(ids, request.args.get('q'), request.args.get('rg'))
+    
+    def cartoes():
+        # Gerações cujos arquivos já foram liberados pela retenção ficam de fora
+        for geracao in geracoes:
+            if not geracao['frente']:
+                continue
+            frente_path = armazem.caminho_arquivo(geracao['frente'])
+            verso_path = armazem.caminho_arquivo(geracao['verso']) if geracao['verso'] else None
+            if os.path.isfile(frente_path):
+                yield frente_path, verso_path if verso_path and os.path.isfile(verso_path) else None
+    
+    try:
+        blocos = gerar_pdf(cartoes(),
+                           colunas=request.args.get('colunas', COLUNAS, type=int),
+                           linhas=request.args.get('linhas', LINHAS, type=int),
+                           espacamento_mm=request.args.get('espacamento', ESPACAMENTO_MM, type=float),
+                           duplex=request.args.get('duplex', 'longa'))
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    
+    nome_pdf = f"carteirinhas_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
+    return Response(stream_with_context(blocos),
+                    mimetype='application/pdf',
+                    headers={'Content-Disposition': f'attachment; filename={nome_pdf}'})
 
 @app.route('/upload_psd', methods=['POST'])
 def upload_psd():
@@ -110,63 +241,62 @@ def upload_psd():
     tipo = request.form.get('tipo')
     file = request.files.get('psd')
     
-    if file and file.filename.endswith('.psd'):
+    if tipo in ['frente', 'verso'] and file and file.filename.endswith('.psd'):
+        from psd_manager import compilar_template, template_compilado_existe, versao_do_hash
+        
         filename = f"{tipo}.psd"
         filepath = os.path.join('static', 'psd_base', filename)
-        file.save(filepath)
-        
-        # Atualizar banco
-        conn = sqlite3.connect(DB_PATH)
-        c = conn.cursor()
         
-        if tipo == 'frente':
-            c.execute("UPDATE config SET psd_frente = ? WHERE id = 1", (filename,))
+        # O upload já foi gravado em um temporário com hash calculado em streaming
+        if isinstance(file.stream, ArquivoComHash):
+            versao = versao_do_hash(file.stream.hexdigest())
+            
+            # Mesmo conteúdo do template atual: nada a reprocessar
+            if (versao == banco.obter_config()[f'versao_{tipo}'] and os.path.exists(filepath)
+                    and template_compilado_existe(tipo, versao)):
+                return redirect('/')
+            
+            file.stream.mover_para(filepath)
         else:
-            c.execute("UPDATE config SET psd_verso = ? WHERE id = 1", (filename,))
-        
-        conn.commit()
-        conn.close()
+            file.save(filepath)
+            versao = None
         
-        # Criar preview
+        # Compilar template (raster achatado + manifesto) uma única vez
         try:
-            from psd_tools import PSDImage
-            from PIL import Image
-            
-            psd = PSDImage.open(filepath)
-            img = psd.composite()
-            img.thumbnail((800, 600), Image.Resampling.LANCZOS)
-            preview_path = os.path.join('static', 'previews', f'preview_{tipo}.png')
-            img.save(preview_path)
+            versao = compilar_template(filepath, tipo, versao=versao)['versao']
         except Exception as e:
-            print(f"Erro ao criar preview: {e}")
+            print(f"Erro ao compilar PSD: {e}")
+            versao = None
+        
+        # Atualizar banco
+        if tipo == 'frente':
+            banco.atualizar_config(psd_frente=filename, versao_frente=versao)
+        else:
+            banco.atualizar_config(psd_verso=filename, versao_verso=versao)
+        
+        # Previews (miniatura, tela e tiles de zoom) são geradas em segundo plano
+        if versao:
+            previews.agendar_previews(tipo, versao)
     
     return redirect('/')
 
 @app.route('/configurar')
 def configurar():
     """Configuração de campos"""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    
     # Verificar se PSDs foram carregados
-    c.execute("SELECT psd_frente, psd_verso FROM config WHERE id = 1")
-    psds = c.fetchone()
+    config = banco.obter_config()
     
-    if not psds or not all(psds):
-        conn.close()
+    if not config['psd_frente'] or not config['psd_verso']:
         return render_template('erro.html', 
                              mensagem="Carregue ambos os PSDs (frente e verso) antes de configurar.")
     
     # Obter campos existentes
-    c.execute("SELECT * FROM campos ORDER BY tipo, id")
-    campos = c.fetchall()
+    campos = banco.listar_campos()
     
     # Separar por tipo
     campos_frente = [c for c in campos if c[3] == 'frente']
     campos_verso = [c for c in campos if c[3] == 'verso']
     
-    conn.close()
-    
     return render_template('configurar.html',
                          campos_frente=campos_frente,
                          campos_verso=campos_verso)
@@ -174,29 +304,48 @@ def configurar():
 @app.route('/visualizar')
 def visualizar():
     """Seleção da área da foto"""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
+    config = banco.obter_config()
     
-    c.execute("SELECT psd_frente FROM config WHERE id = 1")
-    psd_frente = c.fetchone()
-    
-    if not psd_frente or not psd_frente[0]:
-        conn.close()
+    if not config['psd_frente']:
         return redirect('/')
     
-    # Verificar se preview existe
-    preview_path = f'static/previews/preview_frente.png'
-    preview_existe = os.path.exists(preview_path)
-    
-    # Obter área configurada
-    c.execute("SELECT area_foto FROM config WHERE id = 1")
-    area_foto = c.fetchone()[0]
+    # Pirâmide de previews da versão atual (agendada se ainda não existir)
+    versao = config['versao_frente']
+    manifesto = previews.ler_previews('frente', versao)
+    if not manifesto:
+        previews.agendar_previews('frente', versao)
     
-    conn.close()
+    # Obter área configurada e o espaço (dimensões da preview) em que foi capturada
+    area_foto = config['area_foto']
+    espaco_area = json.loads(config['espaco_area']) if config['espaco_area'] else None
+    if area_foto and not espaco_area and manifesto:
+        espaco_area = {'largura': manifesto['niveis']['tela']['largura'],
+                       'altura': manifesto['niveis']['tela']['altura']}
     
     return render_template('visualizar.html',
-                         preview=preview_path if preview_existe else None,
-                         area_foto=area_foto)
+                         preview=manifesto,
+                         preview_url=f"previews/frente_{versao}" if manifesto else None,
+                         gerando_preview=bool(versao) and not manifesto,
+                         area_foto=area_foto,
+                         espaco_area=espaco_area)
+
+@app.route('/api/previews/<tipo>')
+def status_previews(tipo):
+    """Manifesto das previews da versão atual (pronto=False enquanto gera)"""
+    if tipo not in ['frente', 'verso']:
+        return jsonify({'success': False, 'error': 'Tipo inválido'}), 400
+    
+    versao = banco.obter_config()[f'versao_{tipo}']
+    manifesto = previews.ler_previews(tipo, versao)
+    if not manifesto:
+        previews.agendar_previews(tipo, versao)
+    
+    return jsonify({
+        'success': True,
+        'pronto': manifesto is not None,
+        'base': url_for('static', filename=f'previews/{tipo}_{versao}') if manifesto else None,
+        'previews': manifesto
+    })
 
 @app.route('/api/salvar_area', methods=['POST'])
 def salvar_area():
@@ -212,11 +361,13 @@ def salvar_area():
     
     area = json.dumps([x1, y1, x2, y2])
     
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("UPDATE config SET area_foto = ? WHERE id = 1", (area,))
-    conn.commit()
-    conn.close()
+    # Coordenadas ficam no espaço da preview; o mapeamento para o template é feito na renderização
+    espaco = None
+    if data.get('largura') and data.get('altura'):
+        espaco = json.dumps({'largura': data['largura'], 'altura': data['altura'],
+                             'versao': banco.obter_config()['versao_frente']})
+    
+    banco.atualizar_config(area_foto=area, espaco_area=espaco)
     
     return jsonify({'success': True})
 
@@ -228,40 +379,22 @@ def salvar_campo():
     nome_exibicao = data.get('nome_exibicao')
     editavel = data.get('editavel')
     
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    
-    if nome_exibicao:
-        c.execute("UPDATE campos SET nome_exibicao = ? WHERE id = ?", (nome_exibicao, campo_id))
-    
-    if editavel is not None:
-        c.execute("UPDATE campos SET editavel = ? WHERE id = ?", (editavel, campo_id))
-    
-    conn.commit()
-    conn.close()
+    banco.atualizar_campo(campo_id, nome_exibicao, editavel)
     
     return jsonify({'success': True})
 
 @app.route('/gerar')
 def gerar():
     """Página para gerar carteirinha"""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    
     # Verificar configuração completa
-    c.execute("SELECT psd_frente, psd_verso, area_foto FROM config WHERE id = 1")
-    config = c.fetchone()
+    config = banco.obter_config()
     
-    if not config or not config[0] or not config[1] or not config[2]:
-        conn.close()
+    if not config['psd_frente'] or not config['psd_verso'] or not config['area_foto']:
         return render_template('erro.html',
                              mensagem="Configure os PSDs e a área da foto antes de gerar.")
     
     # Obter campos editáveis
-    c.execute("SELECT nome_exibicao FROM campos WHERE editavel = 1")
-    campos = [row[0] for row in c.fetchall()]
-    
-    conn.close()
+    campos = banco.listar_nomes_editaveis()
     
     # Se não houver campos, usar padrão
     if not campos:
@@ -271,7 +404,7 @@ def gerar():
 
 @app.route('/processar', methods=['POST'])
 def processar():
-    """Processar geração da carteirinha"""
+    """Enfileirar geração da carteirinha"""
     # Obter dados do formulário
     dados = {}
     for key, value in request.form.items():
@@ -284,114 +417,143 @@ def processar():
     if foto and foto.filename:
         ext = foto.filename.split('.')[-1].lower()
         if ext in ['png', 'jpg', 'jpeg', 'gif']:
-            foto_nome = f"foto_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{ext}"
-            foto_path = os.path.join('static', 'fotos', foto_nome)
-            foto.save(foto_path)
+            # Nome = hash do conteúdo: sem colisões e sem cópias repetidas
+            foto_nome = armazem.guardar(foto.stream, ext)
     
-    # Obter configurações
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
+    # A renderização acontece nos workers da fila
+    tarefa_id = fila.enfileirar(DB_PATH, dados, foto_nome)
     
-    c.execute("SELECT psd_frente, psd_verso, area_foto FROM config WHERE id = 1")
-    config = c.fetchone()
+    return redirect(url_for('resultado', tarefa_id=tarefa_id))
+
+@app.route('/resultado/<int:tarefa_id>')
+def resultado(tarefa_id):
+    """Resultado da geração (aguarda a tarefa terminar)"""
+    tarefa = fila.obter_tarefa(DB_PATH, tarefa_id)
     
-    # Gerar nomes de arquivo
-    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-    frente_nome = f'frente_{timestamp}.png'
-    verso_nome = f'verso_{timestamp}.png'
+    if not tarefa:
+        return render_template('erro.html', mensagem="Geração não encontrada."), 404
     
-    frente_path = os.path.join('static', 'gerados', frente_nome)
-    verso_path = os.path.join('static', 'gerados', verso_nome)
+    if tarefa['status'] == fila.FALHOU:
+        return render_template('erro.html',
+                             mensagem=f"Erro ao gerar carteirinha: {tarefa['erro']}")
     
-    # Criar imagens (simulação)
-    try:
-        from PIL import Image, ImageDraw, ImageFont
-        
-        # Frente com foto
-        img = Image.new('RGB', (600, 400), color='white')
-        draw = ImageDraw.Draw(img)
-        
-        # Adicionar texto
-        y = 50
-        for campo, valor in dados.items():
-            draw.text((50, y), f"{campo}: {valor}", fill='black')
-            y += 40
-        
-        # Adicionar área da foto
-        if config[2]:
-            area = json.loads(config[2])
-            x1, y1, x2, y2 = area
-            draw.rectangle([x1, y1, x2, y2], outline='red', width=3)
-        
-        img.save(frente_path)
-        
-        # Verso (simples)
-        img = Image.new('RGB', (600, 400), color='lightgray')
-        draw = ImageDraw.Draw(img)
-        draw.text((50, 50), "Verso da Carteirinha", fill='black')
-        draw.text((50, 100), "Sistema OAB", fill='black')
-        img.save(verso_path)
-        
-    except Exception as e:
-        # Arquivos vazios em caso de erro
-        open(frente_path, 'w').close()
-        open(verso_path, 'w').close()
+    return render_template('resultado.html',
+                         tarefa=tarefa,
+                         nome=tarefa['nome'],
+                         rg=tarefa['rg'],
+                         frente=tarefa['frente'],
+                         verso=tarefa['verso'])
+
+@app.route('/api/jobs/<int:tarefa_id>')
+def status_tarefa(tarefa_id):
+    """Status de uma tarefa de geração"""
+    tarefa = fila.obter_tarefa(DB_PATH, tarefa_id)
     
-    # Salvar no histórico
-    nome = dados.get('Nome', 'Sem nome')
-    rg = dados.get('RG', 'Sem RG')
+    if not tarefa:
+        return jsonify({'success': False, 'error': 'Tarefa não encontrada'}), 404
     
-    c.execute('''
-        INSERT INTO historico (nome, rg, foto, frente, verso)
-        VALUES (?, ?, ?, ?, ?)
-    ''', (nome, rg, foto_nome, frente_nome, verso_nome))
+    return jsonify({'success': True, **tarefa})
+
+@app.route('/api/cache_renders')
+def status_cache_renders():
+    """Acertos e falhas do cache de renderizações e do cache de máscaras de texto"""
+    return jsonify({**cache_renders.estatisticas(), 'mascaras_texto': motor.estatisticas_mascaras()})
+
+@app.route('/api/retencao')
+def relatorio_retencao():
+    """Relatório (dry-run) do que a próxima varredura de retenção removeria"""
+    return jsonify(retencao.varrer(dry_run=True))
+
+@app.route('/api/lote', methods=['POST'])
+def processar_lote():
+    """Gerar carteirinhas em lote (roster CSV/JSONL + ZIP de fotos)"""
+    import zipfile
+    from lote import ler_roster, gerar_lote
     
-    conn.commit()
-    conn.close()
+    roster = request.files.get('roster')
+    fotos = request.files.get('fotos')
     
-    return render_template('resultado.html',
-                         nome=nome,
-                         rg=rg,
-                         frente=frente_nome,
-                         verso=verso_nome)
+    if not roster or not roster.filename:
+        return jsonify({'success': False, 'error': 'Envie o roster (CSV ou JSON Lines)'}), 400
+    
+    config = banco.obter_config()
+    campos = banco.listar_campos()
+    if not config['versao_frente'] or not config['versao_verso']:
+        return jsonify({'success': False, 'error': 'Reenvie os PSDs para compilar os templates'}), 400
+    
+    try:
+        fotos_zip = zipfile.ZipFile(fotos.stream) if fotos and fotos.filename else None
+    except zipfile.BadZipFile:
+        return jsonify({'success': False, 'error': 'ZIP de fotos inválido'}), 400
+    
+    linhas = ler_roster(roster.stream, roster.filename)
+    nome_zip = f"carteirinhas_{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip"
+    
+    formato = 'pdf' if request.form.get('formato') == 'pdf' else 'png'
+    return Response(stream_with_context(gerar_lote(linhas, fotos_zip, config, campos, DB_PATH, formato)),
+                    mimetype='application/zip',
+                    headers={'Content-Disposition': f'attachment; filename={nome_zip}'})
 
 @app.route('/download/<arquivo>')
 def download(arquivo):
-    """Download de arquivo gerado"""
-    return send_file(os.path.join('static', 'gerados', arquivo), as_attachment=True)
+    """Download de arquivo gerado (?formato=tiff|jpeg converte a partir do PNG de impressão)"""
+    return entrega.enviar(arquivo, download=True, perfil=request.args.get('formato'))
+
+@app.route('/arquivo/<nome>')
+def arquivo(nome):
+    """Exibição de arquivo gerado (cacheável pelo navegador; ?perfil=tela para a versão leve)"""
+    return entrega.enviar(nome, perfil=request.args.get('perfil'))
 
 @app.route('/api/detectar_campos/<tipo>')
 def detectar_campos(tipo):
-    """Detectar campos do PSD"""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
+    """Detectar campos do PSD (camadas de texto do índice do template compilado)"""
+    if tipo not in ['frente', 'verso']:
+        return jsonify({'success': False, 'error': 'PSD não encontrado'})
     
-    c.execute(f"SELECT psd_{tipo} FROM config WHERE id = 1")
-    psd_nome = c.fetchone()
+    config = banco.obter_config()
+    psd_nome = config[f'psd_{tipo}']
+    versao = config[f'versao_{tipo}']
     
-    if not psd_nome or not psd_nome[0]:
-        conn.close()
+    if not psd_nome:
         return jsonify({'success': False, 'error': 'PSD não encontrado'})
     
-    # Simular detecção (em produção usar psd-tools)
-    campos_simulados = [
-        {'nome': 'Nome', 'posicao': '[100, 150, 300, 200]'},
-        {'nome': 'RG', 'posicao': '[100, 220, 300, 270]'},
-        {'nome': 'CPF', 'posicao': '[100, 290, 300, 340]'},
-        {'nome': 'Foto', 'posicao': '[350, 100, 500, 250]'}
-    ]
+    from psd_manager import compilar_template, ler_manifesto
     
-    # Salvar no banco
-    for campo in campos_simulados:
-        c.execute('''
-            INSERT OR REPLACE INTO campos (nome_original, nome_exibicao, tipo, editavel, posicao)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (campo['nome'], campo['nome'], tipo, 1, campo['posicao']))
+    try:
+        if versao:
+            manifesto = ler_manifesto(tipo, versao)
+        else:
+            # PSD enviado antes da compilação: compilar uma única vez agora
+            manifesto = compilar_template(os.path.join('static', 'psd_base', psd_nome), tipo)
+            banco.atualizar_config(**{f'versao_{tipo}': manifesto['versao']})
+            previews.agendar_previews(tipo, manifesto['versao'])
+    except Exception as e:
+        return jsonify({'success': False, 'error': f'Erro ao ler camadas do PSD: {e}'})
     
-    conn.commit()
-    conn.close()
+    campos = [{'nome': camada['nome'], 'posicao': json.dumps(camada['posicao'])}
+              for camada in manifesto['camadas_texto']]
     
-    return jsonify({'success': True, 'campos': len(campos_simulados)})
+    # Salvar no banco
+    banco.salvar_campos(tipo, campos)
+    
+    return jsonify({'success': True, 'campos': len(campos)})
+
+@app.route('/api/camadas/<tipo>')
+def camadas(tipo):
+    """Árvore de camadas do PSD (nomes, tipos, posições, fontes e textos)"""
+    if tipo not in ['frente', 'verso']:
+        return jsonify({'success': False, 'error': 'PSD não encontrado'}), 404
+    
+    versao = banco.obter_config()[f'versao_{tipo}']
+    if not versao:
+        return jsonify({'success': False, 'error': 'Template não compilado'}), 404
+    
+    from psd_manager import ler_manifesto
+    
+    manifesto = ler_manifesto(tipo, versao)
+    return jsonify({'success': True,
+                    'versao': versao,
+                    'camadas': manifesto.get('camadas', manifesto['camadas_texto'])})
 
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
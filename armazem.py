@@ -0,0 +1,145 @@
+import hashlib
+import os
+import re
+import tempfile
+
+import banco
+
+# Armazenamento endereçado por conteúdo: static/armazem/ab/cd/abcd...ef.png
+PASTA_ARMAZEM = os.path.join('static', 'armazem')
+PASTA_TEMPORARIOS = os.path.join(PASTA_ARMAZEM, 'tmp')
+
+# Nome de um objeto: SHA-256 + extensão
+_PADRAO_OBJETO = re.compile(r'^[0-9a-f]{64}\.[a-z0-9]{1,5}$')
+
+# Objeto importado há menos que isso pode estar a caminho do histórico/cache: não é apagado
+CARENCIA_SEG = int(os.environ.get('OAB_ARMAZEM_CARENCIA_SEG', '300'))
+
+def criar_tabela(c):
+    """Cria a tabela de objetos e os triggers de contagem de referências (chamado pelo init_db)"""
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS objetos (
+            nome TEXT PRIMARY KEY,
+            tamanho INTEGER,
+            refs INTEGER DEFAULT 0,
+            criado TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_objetos_refs ON objetos (refs, criado)")
+    
+    # Cada linha do histórico é uma referência à foto, à frente e ao verso
+    c.execute('''
+        CREATE TRIGGER IF NOT EXISTS objetos_ref_inserir AFTER INSERT ON historico BEGIN
+            UPDATE objetos SET refs = refs + 1 WHERE nome IN (NEW.foto, NEW.frente, NEW.verso);
+        END
+    ''')
+    c.execute('''
+        CREATE TRIGGER IF NOT EXISTS objetos_ref_remover AFTER DELETE ON historico BEGIN
+            UPDATE objetos SET refs = refs - 1 WHERE nome IN (OLD.foto, OLD.frente, OLD.verso);
+        END
+    ''')
+    
+    # A retenção libera arquivos de gerações antigas zerando as colunas
+    c.execute('''
+        CREATE TRIGGER IF NOT EXISTS objetos_ref_atualizar AFTER UPDATE OF foto, frente, verso ON historico BEGIN
+            UPDATE objetos SET refs = refs - 1 WHERE nome IN (OLD.foto, OLD.frente, OLD.verso);
+            UPDATE objetos SET refs = refs + 1 WHERE nome IN (NEW.foto, NEW.frente, NEW.verso);
+        END
+    ''')
+
+def e_objeto(nome):
+    return bool(nome) and bool(_PADRAO_OBJETO.match(nome))
+
+def caminho(nome):
+    """Caminho em disco de um objeto (diretórios fragmentados pelo prefixo do hash)"""
+    return os.path.join(PASTA_ARMAZEM, nome[:2], nome[2:4], nome)
+
+def caminho_arquivo(nome, pasta_legado='gerados'):
+    """Caminho de um arquivo do histórico: objeto do armazém ou nome antigo em static/<pasta_legado>"""
+    if e_objeto(nome):
+        return caminho(nome)
+    return os.path.join('static', pasta_legado, nome)
+
+def temporario(extensao):
+    """Novo arquivo vazio na área temporária do armazém (mesmo disco: rename atômico)"""
+    os.makedirs(PASTA_TEMPORARIOS, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=PASTA_TEMPORARIOS, suffix=f'.{extensao}')
+    os.close(fd)
+    return tmp
+
+def _registrar(nome, tamanho, db_path=None, conn=None):
+    if conn is not None:
+        # Reimportação renova criado: a carência protege o objeto até ele ganhar uma referência
+        conn.execute('''
+            INSERT INTO objetos (nome, tamanho) VALUES (?, ?)
+            ON CONFLICT (nome) DO UPDATE SET criado = CURRENT_TIMESTAMP
+        ''', (nome, tamanho))
+        return
+    with banco.conectar(db_path) as conn:
+        _registrar(nome, tamanho, conn=conn)
+
+def _publicar(tmp, digest, extensao, db_path=None, conn=None):
+    """Move o temporário para o endereço do conteúdo (conteúdo idêntico: mesmo nome, deduplicado).
+    
+    A linha é registrada antes do arquivo e o rename é sempre feito: quem
+    apaga objetos (remover_se_livre) o faz com o lock de escrita, então ou
+    espera este registro, ou já terminou e o arquivo é recolocado aqui.
+    """
+    nome = f'{digest}.{extensao.lower()}'
+    destino = caminho(nome)
+    tamanho = os.path.getsize(tmp)
+    
+    _registrar(nome, tamanho, db_path, conn)
+    os.makedirs(os.path.dirname(destino), exist_ok=True)
+    os.replace(tmp, destino)
+    return nome
+
+def importar(caminho_origem, extensao, db_path=None, conn=None):
+    """Move um arquivo já gravado (ex.: saída do motor) para o armazém e retorna o nome do objeto"""
+    sha = hashlib.sha256()
+    with open(caminho_origem, 'rb') as f:
+        for bloco in iter(lambda: f.read(1024 * 1024), b''):
+            sha.update(bloco)
+    return _publicar(caminho_origem, sha.hexdigest(), extensao, db_path, conn)
+
+def guardar(stream, extensao, db_path=None, conn=None):
+    """Copia um stream (upload, entrada de ZIP) para o armazém calculando o hash em blocos"""
+    tmp = temporario(extensao)
+    sha = hashlib.sha256()
+    try:
+        with open(tmp, 'wb') as f:
+            for bloco in iter(lambda: stream.read(1024 * 1024), b''):
+                sha.update(bloco)
+                f.write(bloco)
+        return _publicar(tmp, sha.hexdigest(), extensao, db_path, conn)
+    except Exception:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+def descartar(*caminhos):
+    """Remove temporários que não chegaram a ser publicados"""
+    for item in caminhos:
+        if item and os.path.exists(item) and os.path.dirname(os.path.abspath(item)) == os.path.abspath(PASTA_TEMPORARIOS):
+            os.remove(item)
+
+def remover_se_livre(conn, nome, carencia_seg=CARENCIA_SEG):
+    """Apaga o objeto (linha e arquivo) se não tem referências nem foi importado há pouco.
+    
+    Roda na transação de escrita do chamador e o arquivo sai antes do commit,
+    com a contagem de referências conferida no próprio DELETE.
+    """
+    removido = conn.execute("DELETE FROM objetos WHERE nome = ? AND refs <= 0 AND criado < datetime('now', ?)",
+                            (nome, f"-{carencia_seg} seconds")).rowcount
+    if removido:
+        try:
+            os.remove(caminho(nome))
+        except FileNotFoundError:
+            pass
+    return bool(removido)
+
+def sem_referencias(db_path=None):
+    """Objetos que nenhuma linha do histórico referencia (candidatos à limpeza)"""
+    c = banco.conectar(db_path).execute(
+        "SELECT nome, tamanho, criado FROM objetos WHERE refs <= 0 ORDER BY criado")
+    return c.fetchall()
@@ -0,0 +1,365 @@
+import os
+import sqlite3
+import threading
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DB_PATH = os.path.join(BASE_DIR, 'database.db')
+
+# Espera por um lock de escrita (o sqlite3 aplica como busy_timeout da conexão)
+TIMEOUT_LOCK = 30
+
+# Ajustes aplicados a toda conexão nova
+PRAGMAS = [
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA cache_size = -16000",
+    "PRAGMA mmap_size = 268435456",
+    "PRAGMA temp_store = MEMORY"
+]
+
+# Colunas da tabela config que podem ser atualizadas
+COLUNAS_CONFIG = ['psd_frente', 'psd_verso', 'area_foto', 'versao_frente', 'versao_verso', 'espaco_area']
+
+_local = threading.local()
+
+# Cache em memória de config/campos, validado pelo contador config.geracao
+_caches = {}
+_caches_lock = threading.Lock()
+
+def conectar(db_path=None):
+    """Retorna a conexão da thread atual (uma por thread/processo/banco).
+    
+    A conexão fica aberta e reaproveita o cache de statements preparados
+    do sqlite3 entre requisições.
+    """
+    db_path = db_path or DB_PATH
+    pid = os.getpid()
+    
+    # Conexões não sobrevivem a fork: recriar no processo filho
+    if getattr(_local, 'pid', None) != pid:
+        _local.pid = pid
+        _local.conexoes = {}
+    
+    conn = _local.conexoes.get(db_path)
+    if conn is None:
+        conn = sqlite3.connect(db_path, timeout=TIMEOUT_LOCK, cached_statements=256)
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        _local.conexoes[db_path] = conn
+    
+    return conn
+
+def fechar_conexoes():
+    """Fecha as conexões da thread atual"""
+    for conn in getattr(_local, 'conexoes', {}).values():
+        conn.close()
+    _local.conexoes = {}
+
+# ============ CACHE DE CONFIGURAÇÃO ============
+
+def _cache_valido(db_path):
+    """Retorna o cache de config/campos deste banco, descartando-o se outro
+    processo (ou thread) gravou uma nova geração.
+    
+    PRAGMA data_version só muda quando outra conexão faz commit, então na
+    maioria das leituras nenhuma consulta às tabelas é feita.
+    """
+    db_path = db_path or DB_PATH
+    conn = conectar(db_path)
+    
+    versoes = getattr(_local, 'data_versions', None)
+    if versoes is None or getattr(_local, 'data_versions_pid', None) != os.getpid():
+        versoes = _local.data_versions = {}
+        _local.data_versions_pid = os.getpid()
+    
+    with _caches_lock:
+        cache = _caches.setdefault(db_path, {'geracao': None})
+    
+    data_version = conn.execute("PRAGMA data_version").fetchone()[0]
+    if versoes.get(db_path) == data_version and cache['geracao'] is not None:
+        return cache
+    
+    row = conn.execute("SELECT geracao FROM config WHERE id = 1").fetchone()
+    geracao = row[0] if row else 0
+    versoes[db_path] = data_version
+    
+    with _caches_lock:
+        cache = _caches[db_path]
+        if cache['geracao'] != geracao:
+            cache = _caches[db_path] = {'geracao': geracao}
+    
+    return cache
+
+def _nova_geracao(conn):
+    """Incrementa a geração na transação do chamador"""
+    conn.execute("UPDATE config SET geracao = COALESCE(geracao, 0) + 1 WHERE id = 1")
+
+def invalidar_cache(db_path=None):
+    """Descarta o cache deste processo (chamar depois do commit de uma escrita).
+    
+    Os commits da própria conexão não alteram PRAGMA data_version, então a
+    verificação desta thread também é zerada.
+    """
+    db_path = db_path or DB_PATH
+    with _caches_lock:
+        _caches[db_path] = {'geracao': None}
+    getattr(_local, 'data_versions', {}).pop(db_path, None)
+
+# ============ CONFIG ============
+
+def obter_config(db_path=None):
+    """Retorna a configuração do sistema como dicionário"""
+    cache = _cache_valido(db_path)
+    
+    config = cache.get('config')
+    if config is None:
+        c = conectar(db_path).execute(f"SELECT {', '.join(COLUNAS_CONFIG)} FROM config WHERE id = 1")
+        row = c.fetchone()
+        config = cache['config'] = dict(zip(COLUNAS_CONFIG, row)) if row else dict.fromkeys(COLUNAS_CONFIG)
+    
+    return dict(config)
+
+def atualizar_config(db_path=None, **valores):
+    """Atualiza colunas da configuração (apenas as de COLUNAS_CONFIG)"""
+    colunas = [coluna for coluna in valores if coluna in COLUNAS_CONFIG]
+    if not colunas:
+        return
+    
+    atribuicoes = ', '.join(f"{coluna} = ?" for coluna in colunas)
+    with conectar(db_path) as conn:
+        conn.execute(f"UPDATE config SET {atribuicoes}, atualizado = CURRENT_TIMESTAMP WHERE id = 1",
+                     [valores[coluna] for coluna in colunas])
+        _nova_geracao(conn)
+    
+    invalidar_cache(db_path)
+
+# ============ CAMPOS ============
+
+def listar_campos(tipo=None, db_path=None):
+    """Lista os campos (id, nome_original, nome_exibicao, tipo, editavel, posicao)"""
+    cache = _cache_valido(db_path)
+    
+    campos = cache.get('campos')
+    if campos is None:
+        c = conectar(db_path).execute("SELECT * FROM campos ORDER BY tipo, id")
+        campos = cache['campos'] = c.fetchall()
+    
+    if tipo:
+        return [campo for campo in campos if campo[3] == tipo]
+    return list(campos)
+
+def listar_nomes_editaveis(db_path=None):
+    """Nomes de exibição dos campos editáveis (formulário de geração)"""
+    return [campo[2] for campo in sorted(listar_campos(db_path=db_path)) if campo[4] == 1]
+
+def atualizar_campo(campo_id, nome_exibicao=None, editavel=None, db_path=None):
+    """Atualiza nome de exibição e/ou flag editável de um campo"""
+    with conectar(db_path) as conn:
+        if nome_exibicao:
+            conn.execute("UPDATE campos SET nome_exibicao = ? WHERE id = ?", (nome_exibicao, campo_id))
+        
+        if editavel is not None:
+            conn.execute("UPDATE campos SET editavel = ? WHERE id = ?", (editavel, campo_id))
+        
+        _nova_geracao(conn)
+    
+    invalidar_cache(db_path)
+
+def salvar_campos(tipo, campos, db_path=None):
+    """Sincroniza os campos detectados (dicionários com nome e posicao) de um lado.
+    
+    Campos já existentes mantêm nome de exibição e flag editável e só têm a
+    posição atualizada; campos que não existem mais no PSD são removidos.
+    """
+    with conectar(db_path) as conn:
+        existentes = {row[1]: row[0] for row in conn.execute(
+            "SELECT id, nome_original FROM campos WHERE tipo = ?", (tipo,))}
+        
+        for campo in campos:
+            campo_id = existentes.pop(campo['nome'], None)
+            if campo_id is None:
+                conn.execute('''
+                    INSERT INTO campos (nome_original, nome_exibicao, tipo, editavel, posicao)
+                    VALUES (?, ?, ?, ?, ?)
+                ''', (campo['nome'], campo['nome'], tipo, 1, campo['posicao']))
+            else:
+                conn.execute("UPDATE campos SET posicao = ? WHERE id = ?", (campo['posicao'], campo_id))
+        
+        conn.executemany("DELETE FROM campos WHERE id = ?", [(campo_id,) for campo_id in existentes.values()])
+        _nova_geracao(conn)
+    
+    invalidar_cache(db_path)
+
+# ============ HISTÓRICO ============
+
+# Página padrão e máxima da listagem de histórico
+LIMITE_HISTORICO = 50
+LIMITE_HISTORICO_MAX = 500
+
+_fts_disponivel = None
+
+def criar_estruturas_historico(c):
+    """Índices, busca textual (FTS5) e contador mantido do histórico (chamado pelo init_db)"""
+    c.execute("CREATE INDEX IF NOT EXISTS idx_historico_nome ON historico (nome)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_historico_rg ON historico (rg)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_historico_data ON historico (data)")
+    
+    # Contador mantido por triggers (evita COUNT(*) na página inicial)
+    c.execute("CREATE TABLE IF NOT EXISTS contadores (nome TEXT PRIMARY KEY, valor INTEGER NOT NULL)")
+    c.execute("INSERT OR IGNORE INTO contadores (nome, valor) SELECT 'historico', COUNT(*) FROM historico")
+    c.execute('''
+        CREATE TRIGGER IF NOT EXISTS historico_contador_ai AFTER INSERT ON historico BEGIN
+            UPDATE contadores SET valor = valor + 1 WHERE nome = 'historico';
+        END
+    ''')
+    c.execute('''
+        CREATE TRIGGER IF NOT EXISTS historico_contador_ad AFTER DELETE ON historico BEGIN
+            UPDATE contadores SET valor = valor - 1 WHERE nome = 'historico';
+        END
+    ''')
+    
+    # Busca textual por nome/RG (se o SQLite tiver FTS5)
+    c.execute("SELECT 1 FROM sqlite_master WHERE name = 'historico_fts'")
+    if c.fetchone():
+        return
+    
+    try:
+        c.execute('''
+            CREATE VIRTUAL TABLE historico_fts USING fts5(
+                nome, rg, content='historico', content_rowid='id', tokenize='unicode61'
+            )
+        ''')
+    except sqlite3.OperationalError as e:
+        print(f"FTS5 indisponível, busca do histórico usará LIKE: {e}")
+        return
+    
+    c.execute('''
+        CREATE TRIGGER historico_fts_ai AFTER INSERT ON historico BEGIN
+            INSERT INTO historico_fts (rowid, nome, rg) VALUES (new.id, new.nome, new.rg);
+        END
+    ''')
+    c.execute('''
+        CREATE TRIGGER historico_fts_ad AFTER DELETE ON historico BEGIN
+            INSERT INTO historico_fts (historico_fts, rowid, nome, rg) VALUES ('delete', old.id, old.nome, old.rg);
+        END
+    ''')
+    c.execute('''
+        CREATE TRIGGER historico_fts_au AFTER UPDATE OF nome, rg ON historico BEGIN
+            INSERT INTO historico_fts (historico_fts, rowid, nome, rg) VALUES ('delete', old.id, old.nome, old.rg);
+            INSERT INTO historico_fts (rowid, nome, rg) VALUES (new.id, new.nome, new.rg);
+        END
+    ''')
+    c.execute("INSERT INTO historico_fts (historico_fts) VALUES ('rebuild')")
+
+def _tem_fts(conn):
+    global _fts_disponivel
+    if _fts_disponivel is None:
+        row = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'historico_fts'").fetchone()
+        _fts_disponivel = row is not None
+    return _fts_disponivel
+
+def _consulta_fts(texto):
+    """Converte o texto digitado em uma consulta FTS5 segura (prefixo por termo)"""
+    termos = [termo.replace('"', '') for termo in texto.split()]
+    return ' '.join(f'"{termo}"*' for termo in termos if termo)
+
+def registrar_historico(nome, rg, foto, frente, verso, db_path=None, conn=None):
+    """Insere uma geração no histórico e retorna o id.
+    
+    Se conn for passada, a inserção participa da transação do chamador.
+    """
+    if conn is not None:
+        return conn.execute('''
+            INSERT INTO historico (nome, rg, foto, frente, verso)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (nome, rg, foto, frente, verso)).lastrowid
+    
+    with conectar(db_path) as conn:
+        return registrar_historico(nome, rg, foto, frente, verso, conn=conn)
+
+def total_historico(db_path=None):
+    """Número total de gerações (contador mantido por trigger)"""
+    row = conectar(db_path).execute("SELECT valor FROM contadores WHERE nome = 'historico'").fetchone()
+    return row[0] if row else 0
+
+def ultimos_historico(limite=5, db_path=None):
+    """Últimas gerações (nome, rg, data, frente, verso)"""
+    c = conectar(db_path).execute(
+        "SELECT nome, rg, data, frente, verso FROM historico ORDER BY id DESC LIMIT ?", (limite,))
+    return c.fetchall()
+
+def buscar_historico(texto=None, rg=None, antes=None, limite=LIMITE_HISTORICO, db_path=None):
+    """Página do histórico em ordem decrescente, com paginação por id (keyset).
+    
+    texto: busca por nome/RG (FTS5, por prefixo); rg: RG exato (índice)
+    antes: id da última linha da página anterior
+    Retorna (linhas, proximo), onde proximo é o cursor da página seguinte ou None.
+    """
+    conn = conectar(db_path)
+    limite = max(1, min(int(limite), LIMITE_HISTORICO_MAX))
+    
+    condicoes = []
+    parametros = []
+    tabelas = "historico h"
+    
+    if texto and texto.strip():
+        if _tem_fts(conn):
+            # Texto só com aspas não tem termos: sem filtro (MATCH '' é erro de sintaxe no FTS5)
+            consulta = _consulta_fts(texto)
+            if consulta:
+                tabelas = "historico_fts f JOIN historico h ON h.id = f.rowid"
+                condicoes.append("historico_fts MATCH ?")
+                parametros.append(consulta)
+        else:
+            condicoes.append("(h.nome LIKE ? OR h.rg LIKE ?)")
+            parametros += [f"{texto.strip()}%"] * 2
+    
+    if rg:
+        condicoes.append("h.rg = ?")
+        parametros.append(rg)
+    
+    if antes:
+        condicoes.append("h.id < ?")
+        parametros.append(int(antes))
+    
+    where = f"WHERE {' AND '.join(condicoes)}" if condicoes else ""
+    c = conn.execute(f'''
+        SELECT h.id, h.nome, h.rg, h.data, h.frente, h.verso
+        FROM {tabelas} {where}
+        ORDER BY h.id DESC LIMIT ?
+    ''', parametros + [limite + 1])
+    
+    colunas = ['id', 'nome', 'rg', 'data', 'frente', 'verso']
+    linhas = [dict(zip(colunas, row)) for row in c.fetchall()]
+    
+    proximo = None
+    if len(linhas) > limite:
+        linhas = linhas[:limite]
+        proximo = linhas[-1]['id']
+    
+    return linhas, proximo
+
+def historico_para_impressao(ids=None, texto=None, rg=None, db_path=None):
+    """Gerações (id, nome, frente, verso) a imprimir: os ids na ordem dada ou o resultado da busca.
+    
+    Percorre o histórico em páginas (keyset), sem carregar tudo em memória.
+    """
+    if ids:
+        conn = conectar(db_path)
+        for inicio in range(0, len(ids), LIMITE_HISTORICO_MAX):
+            bloco = ids[inicio:inicio + LIMITE_HISTORICO_MAX]
+            rows = conn.execute(f"SELECT id, nome, frente, verso FROM historico WHERE id IN ({','.join('?' * len(bloco))})",
+                                bloco).fetchall()
+            por_id = {row[0]: row for row in rows}
+            for id_ in bloco:
+                if id_ in por_id:
+                    yield dict(zip(['id', 'nome', 'frente', 'verso'], por_id[id_]))
+        return
+    
+    antes = None
+    while True:
+        linhas, antes = buscar_historico(texto, rg, antes, LIMITE_HISTORICO_MAX, db_path)
+        for linha in linhas:
+            yield linha
+        if antes is None:
+            break
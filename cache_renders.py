@@ -0,0 +1,227 @@
+import hashlib
+import json
+import os
+import threading
+import unicodedata
+
+import armazem
+import banco
+
+# Limite do cache de renderizações (soma de frente + verso das entradas)
+CACHE_RENDERS_MAX_BYTES = int(os.environ.get('OAB_CACHE_RENDERS_MB', '1024')) * 1024 * 1024
+
+# Versão do renderizador: incrementar quando a mesma entrada passar a gerar outra imagem
+# (2: composição parcial, sem os placeholders das camadas dinâmicas)
+VERSAO_RENDER = 2
+
+_lados_fixos_lock = threading.Lock()
+
+def criar_tabela(c):
+    """Cria a tabela do cache e seus contadores (chamado pelo init_db, depois do armazém)"""
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS cache_renders (
+            chave TEXT PRIMARY KEY,
+            frente TEXT,
+            verso TEXT,
+            tamanho INTEGER,
+            usado TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_cache_renders_usado ON cache_renders (usado)")
+    
+    # Entradas do cache também são referências aos objetos do armazém
+    c.execute('''
+        CREATE TRIGGER IF NOT EXISTS cache_renders_ref_inserir AFTER INSERT ON cache_renders BEGIN
+            UPDATE objetos SET refs = refs + 1 WHERE nome IN (NEW.frente, NEW.verso);
+        END
+    ''')
+    c.execute('''
+        CREATE TRIGGER IF NOT EXISTS cache_renders_ref_remover AFTER DELETE ON cache_renders BEGIN
+            UPDATE objetos SET refs = refs - 1 WHERE nome IN (OLD.frente, OLD.verso);
+        END
+    ''')
+    
+    for nome in ('cache_renders_acertos', 'cache_renders_falhas', 'cache_renders_bytes'):
+        c.execute("INSERT OR IGNORE INTO contadores (nome, valor) VALUES (?, 0)", (nome,))
+    
+    # Lados sem campos por membro: renderizados uma vez por versão do template
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS lados_fixos (
+            tipo TEXT,
+            versao TEXT,
+            nome TEXT,
+            PRIMARY KEY (tipo, versao)
+        )
+    ''')
+
+def normalizar_dados(dados):
+    """Valores do formulário em forma canônica (NFC, sem espaços repetidos ou nas pontas)"""
+    return {chave: ' '.join(unicodedata.normalize('NFC', str(valor)).split()) if valor is not None else None
+            for chave, valor in dados.items()}
+
+def chave_render(config, campos, area_foto, dados, foto_nome):
+    """Chave do cache: versões dos templates, layout, valores normalizados e hash da foto.
+    
+    foto_nome é o nome do objeto no armazém, que já é o hash do conteúdo.
+    Sem templates compilados não há chave (a simulação não é cacheada).
+    """
+    if not config['versao_frente'] or not config['versao_verso']:
+        return None
+    
+    # Template ainda em recompilação (atualizar_templates): o render não é o definitivo
+    from psd_manager import composicao_parcial
+    if not composicao_parcial('frente', config['versao_frente']) or not composicao_parcial('verso', config['versao_verso']):
+        return None
+    
+    # Apenas os valores que aparecem no cartão (campos editáveis posicionados)
+    valores = {campo[2]: dados.get(campo[2]) for campo in campos if campo[4] and campo[5]}
+    
+    material = json.dumps({
+        'render': VERSAO_RENDER,
+        'frente': config['versao_frente'],
+        'verso': config['versao_verso'],
+        'area': area_foto,
+        'campos': [list(campo[1:]) for campo in campos],
+        'valores': valores,
+        'foto': foto_nome
+    }, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+def _contar(conn, nome, quantidade=1):
+    conn.execute("UPDATE contadores SET valor = valor + ? WHERE nome = ?", (quantidade, nome))
+
+def buscar(chave, db_path=None, conn=None, contar_falha=True):
+    """Retorna (frente, verso) de uma renderização idêntica já feita, ou None"""
+    if chave is None:
+        return None
+    if conn is None:
+        with banco.conectar(db_path) as conn:
+            return buscar(chave, conn=conn, contar_falha=contar_falha)
+    
+    row = conn.execute("SELECT frente, verso FROM cache_renders WHERE chave = ?", (chave,)).fetchone()
+    
+    # Entrada cujo arquivo sumiu do disco conta como falha e é descartada
+    if row and not all(os.path.exists(armazem.caminho(nome)) for nome in row):
+        _remover(conn, chave)
+        row = None
+    
+    if row:
+        conn.execute("UPDATE cache_renders SET usado = CURRENT_TIMESTAMP WHERE chave = ?", (chave,))
+        _contar(conn, 'cache_renders_acertos')
+        return row[0], row[1]
+    
+    if contar_falha:
+        _contar(conn, 'cache_renders_falhas')
+    return None
+
+def _remover(conn, chave):
+    row = conn.execute("SELECT frente, verso, tamanho FROM cache_renders WHERE chave = ?", (chave,)).fetchone()
+    if not row:
+        return
+    conn.execute("DELETE FROM cache_renders WHERE chave = ?", (chave,))
+    _contar(conn, 'cache_renders_bytes', -row[2])
+    
+    # Objetos que ficaram sem nenhuma referência saem do disco (os recém-importados ficam para a retenção)
+    for nome in set(row[:2]):
+        armazem.remover_se_livre(conn, nome)
+
+def guardar(chave, frente, verso, db_path=None, conn=None):
+    """Registra uma renderização no cache e aplica o limite de tamanho (LRU)"""
+    if chave is None:
+        return
+    if conn is None:
+        with banco.conectar(db_path) as conn:
+            return guardar(chave, frente, verso, conn=conn)
+    
+    # Lados fixos são compartilhados por todas as entradas: só conta os bytes que a entrada possui
+    fixos = {row[0] for row in conn.execute("SELECT nome FROM lados_fixos WHERE nome IN (?, ?)", (frente, verso))}
+    tamanho = sum(os.path.getsize(armazem.caminho(nome)) for nome in {frente, verso} - fixos)
+    if conn.execute('''
+        INSERT OR IGNORE INTO cache_renders (chave, frente, verso, tamanho) VALUES (?, ?, ?, ?)
+    ''', (chave, frente, verso, tamanho)).rowcount:
+        _contar(conn, 'cache_renders_bytes', tamanho)
+    
+    # Remover as entradas usadas há mais tempo até caber no limite
+    total = conn.execute("SELECT valor FROM contadores WHERE nome = 'cache_renders_bytes'").fetchone()[0]
+    if total > CACHE_RENDERS_MAX_BYTES:
+        antigas = conn.execute("SELECT chave, tamanho FROM cache_renders ORDER BY usado, rowid").fetchall()
+        for antiga, tamanho_antiga in antigas:
+            if total <= CACHE_RENDERS_MAX_BYTES:
+                break
+            _remover(conn, antiga)
+            total -= tamanho_antiga
+
+def lado_sem_campos(tipo, campos, com_foto=False):
+    """True se o lado não tem nada por membro (nenhum campo editável posicionado, sem foto)"""
+    return not com_foto and not any(campo[3] == tipo and campo[4] and campo[5] for campo in campos)
+
+def lado_fixo(tipo, versao, campos, com_foto=False, db_path=None, conn=None):
+    """Objeto do armazém com o lado renderizado uma única vez para a versão, ou None.
+    
+    Lados com campos por membro (ou com a foto) retornam None e seguem o
+    render normal. versao=None é a simulação (só o verso é fixo).
+    """
+    if versao is None and tipo != 'verso':
+        return None
+    if versao is not None and not lado_sem_campos(tipo, campos, com_foto):
+        return None
+    if versao is not None:
+        from psd_manager import composicao_parcial
+        if not composicao_parcial(tipo, versao):
+            return None
+    if conn is None:
+        with banco.conectar(db_path) as conn:
+            return lado_fixo(tipo, versao, campos, com_foto, conn=conn)
+    
+    chave_versao = f"{versao or 'simulacao'}-r{VERSAO_RENDER}"
+    consulta = "SELECT nome FROM lados_fixos WHERE tipo = ? AND versao = ?"
+    
+    row = conn.execute(consulta, (tipo, chave_versao)).fetchone()
+    if row and os.path.exists(armazem.caminho(row[0])):
+        return row[0]
+    
+    # Um render por processo mesmo com várias threads da fila pedindo ao mesmo tempo
+    with _lados_fixos_lock:
+        row = conn.execute(consulta, (tipo, chave_versao)).fetchone()
+        if row and os.path.exists(armazem.caminho(row[0])):
+            return row[0]
+        
+        import formatos
+        from psd_manager import renderizar_carteirinha, verso_simulado
+        img = verso_simulado() if versao is None else renderizar_carteirinha(tipo, versao, {}, campos)
+        
+        tmp = armazem.temporario('png')
+        try:
+            formatos.salvar_perfil(img, tmp, 'impressao')
+            nome = armazem.importar(tmp, 'png', conn=conn)
+        finally:
+            armazem.descartar(tmp)
+        
+        tela = formatos.caminho_derivada(nome, 'tela')
+        if not os.path.exists(tela):
+            tmp = armazem.temporario(formatos.extensao('tela'))
+            formatos.salvar_perfil(img, tmp, 'tela')
+            formatos.publicar_derivada(tmp, nome, 'tela')
+        
+        conn.execute("INSERT OR REPLACE INTO lados_fixos (tipo, versao, nome) VALUES (?, ?, ?)",
+                     (tipo, chave_versao, nome))
+    
+    return nome
+
+def estatisticas(db_path=None):
+    """Acertos, falhas, taxa de acerto, entradas e bytes do cache"""
+    conn = banco.conectar(db_path)
+    contadores = dict(conn.execute(
+        "SELECT nome, valor FROM contadores WHERE nome LIKE 'cache_renders_%'").fetchall())
+    entradas = conn.execute("SELECT COUNT(*) FROM cache_renders").fetchone()[0]
+    
+    acertos = contadores.get('cache_renders_acertos', 0)
+    falhas = contadores.get('cache_renders_falhas', 0)
+    return {
+        'acertos': acertos,
+        'falhas': falhas,
+        'taxa_acerto': acertos / (acertos + falhas) if acertos + falhas else 0.0,
+        'entradas': entradas,
+        'bytes': contadores.get('cache_renders_bytes', 0),
+        'limite_bytes': CACHE_RENDERS_MAX_BYTES
+    }
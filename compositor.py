@@ -0,0 +1,95 @@
+import threading
+
+from PIL import Image
+
+from fontes import mascara_texto
+from fotos import foto_normalizada
+from psd_manager import campos_do_cartao, carregar_compilado, fundo_estatico
+
+# NumPy é opcional: sem ele o lote renderiza cartão a cartão com o Pillow
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+NUMPY = np is not None
+
+class CompositorLote:
+    """Compõe muitos cartões de um lado com a base em um array NumPy.
+    
+    A base (fundo estático do conjunto de campos) é convertida uma vez; cada
+    cartão é copiado para um buffer pré-alocado, recebe os textos (máscaras do
+    cache de textos) por mistura alfa vetorizada nas caixas dos campos e a
+    foto, e é entregue ao codificador
+    como uma Image que aponta para o próprio buffer (sem cópia). A mistura usa
+    a mesma aritmética do Pillow, então a saída é idêntica à do renderizador
+    cartão a cartão.
+    """
+    
+    def __init__(self, tipo, versao, campos, com_foto=False):
+        self.tipo = tipo
+        self.campos = campos
+        self.com_foto = com_foto
+        _, self.manifesto = carregar_compilado(tipo, versao)
+        
+        campos_dinamicos = frozenset(campo[1] for campo in campos if campo[3] == tipo and campo[4] and campo[5])
+        self.base = np.asarray(fundo_estatico(tipo, versao, campos_dinamicos, com_foto).convert('RGB'))
+        self.altura, self.largura = self.base.shape[:2]
+        self.buffer = np.empty_like(self.base)
+        
+        # O buffer é único: compor e codificar de um cartão não podem se intercalar com outro
+        self.lock = threading.Lock()
+    
+    def _misturar(self, mascara, canto, cor):
+        """dst = (dst * (255 - m) + cor * m) / 255, com o arredondamento do Pillow"""
+        x, y = canto
+        altura, largura = mascara.shape[:2]
+        
+        # Recortar ao canvas
+        ox, oy = max(0, -x), max(0, -y)
+        x2, y2 = min(self.largura, x + largura), min(self.altura, y + altura)
+        x, y = max(0, x), max(0, y)
+        if x >= x2 or y >= y2:
+            return
+        
+        m = mascara[oy:oy + y2 - y, ox:ox + x2 - x]
+        regiao = self.buffer[y:y2, x:x2]
+        tmp = regiao * (255 - m) + np.asarray(cor[:3], dtype=np.uint16) * m + 128
+        regiao[...] = ((tmp >> 8) + tmp) >> 8
+    
+    def compor(self, dados, foto_path=None, area_foto=None):
+        """Compõe um cartão; a Image devolvida é válida até a próxima chamada"""
+        np.copyto(self.buffer, self.base)
+        
+        for texto, origem, familia, tamanho, cor in campos_do_cartao(self.manifesto, self.tipo, dados, self.campos):
+            canto, mascara = mascara_texto(texto, origem, familia, tamanho)
+            self._misturar(np.asarray(mascara, dtype=np.uint16)[..., None], canto, cor)
+        
+        if self.com_foto and foto_path and area_foto:
+            try:
+                x1, y1, x2, y2 = area_foto
+                foto = np.asarray(foto_normalizada(foto_path, (x2 - x1, y2 - y1)).convert('RGB'))
+                
+                # Recortar ao canvas (a área pode passar da borda)
+                cx1, cy1 = max(0, x1), max(0, y1)
+                cx2, cy2 = min(self.largura, x2), min(self.altura, y2)
+                if cx1 < cx2 and cy1 < cy2:
+                    self.buffer[cy1:cy2, cx1:cx2] = foto[cy1 - y1:cy2 - y1, cx1 - x1:cx2 - x1]
+            except Exception as e:
+                print(f"Erro ao inserir foto: {e}")
+        
+        return Image.frombuffer('RGB', (self.largura, self.altura), self.buffer, 'raw', 'RGB', 0, 1)
+
+_compositores = {}
+_compositores_lock = threading.Lock()
+
+def compositor(tipo, versao, campos, com_foto=False):
+    """Compositor deste processo para (template, campos, foto); criado no primeiro uso"""
+    chave = (tipo, versao, tuple(tuple(campo) for campo in campos), com_foto)
+    with _compositores_lock:
+        if chave not in _compositores:
+            # Só os conjuntos mais recentes ficam (cada um guarda base + buffer)
+            if len(_compositores) >= 4:
+                _compositores.pop(next(iter(_compositores)))
+            _compositores[chave] = CompositorLote(tipo, versao, campos, com_foto)
+        return _compositores[chave]
@@ -0,0 +1,45 @@
+import json
+from collections import namedtuple
+
+from previews import NIVEIS
+
+class Transformacao(namedtuple('Transformacao', ['escala_x', 'escala_y'])):
+    """Escala entre o espaço da preview (onde o usuário clica) e o template em resolução total"""
+    
+    def para_template(self, caixa):
+        x1, y1, x2, y2 = caixa
+        return [round(x1 * self.escala_x), round(y1 * self.escala_y),
+                round(x2 * self.escala_x), round(y2 * self.escala_y)]
+    
+    def para_preview(self, caixa):
+        x1, y1, x2, y2 = caixa
+        return [round(x1 / self.escala_x), round(y1 / self.escala_y),
+                round(x2 / self.escala_x), round(y2 / self.escala_y)]
+
+def espaco_tela(largura, altura):
+    """Dimensões da preview de tela de um template (mesma regra do thumbnail do Pillow)"""
+    limite_w, limite_h = NIVEIS['tela']
+    if largura <= limite_w and altura <= limite_h:
+        return {'largura': largura, 'altura': altura}
+    
+    escala = min(limite_w / largura, limite_h / altura)
+    return {'largura': max(1, round(largura * escala)), 'altura': max(1, round(altura * escala))}
+
+def transformacao_template(manifesto, espaco=None):
+    """Transformação de um espaço de captura para o template desta versão.
+    
+    espaco: {'largura', 'altura'} da imagem em que as coordenadas foram
+    capturadas. Sem espaço (áreas salvas antes do mapeamento), assume a
+    preview de tela da própria versão, que era a imagem exibida na seleção.
+    """
+    espaco = espaco or espaco_tela(manifesto['largura'], manifesto['altura'])
+    return Transformacao(manifesto['largura'] / espaco['largura'],
+                         manifesto['altura'] / espaco['altura'])
+
+def area_foto_template(config, manifesto):
+    """Área da foto da configuração convertida para pixels do template (ou None)"""
+    if not config['area_foto']:
+        return None
+    
+    espaco = json.loads(config['espaco_area']) if config.get('espaco_area') else None
+    return transformacao_template(manifesto, espaco).para_template(json.loads(config['area_foto']))
@@ -0,0 +1,79 @@
+import os
+import re
+
+from flask import abort, send_file
+
+import armazem
+import formatos
+
+# Repasse do envio ao proxy: '' (Flask envia), 'x-sendfile' (Apache/lighttpd) ou 'x-accel' (nginx)
+MODO_SENDFILE = os.environ.get('OAB_SENDFILE', '').lower()
+
+# Location interna do nginx que aponta para a pasta static/ (ex.: location /interno/ { internal; alias .../static/; })
+PREFIXO_X_ACCEL = os.environ.get('OAB_X_ACCEL_PREFIX', '/interno/')
+
+# Objetos do armazém nunca mudam de conteúdo
+MAX_AGE_IMUTAVEL = 365 * 24 * 3600
+
+# Nomes gerados antes do armazém (frente_20240101_120000.png, verso_..._3.png)
+_PADRAO_LEGADO = re.compile(r'^(frente|verso)_[0-9_]+\.png$')
+
+def resolver(nome):
+    """Caminho de uma saída conhecida, ou 404.
+    
+    Só são servidos objetos do armazém (nome = hash, validado pelo padrão)
+    e saídas antigas com o padrão de nome do gerador: nenhum nome vindo da
+    URL é concatenado a um caminho sem passar por essa validação.
+    """
+    if armazem.e_objeto(nome):
+        caminho = armazem.caminho(nome)
+    elif _PADRAO_LEGADO.match(nome or ''):
+        caminho = armazem.caminho_arquivo(nome)
+    else:
+        abort(404)
+    
+    if not os.path.isfile(caminho):
+        abort(404)
+    return caminho
+
+def enviar(nome, download=False, perfil=None):
+    """Resposta com ETag forte, Last-Modified, Range e (opcional) repasse ao proxy.
+    
+    perfil escolhe uma derivada de formatos.PERFIS (tela, tiff, jpeg...),
+    codificada a partir do PNG de impressão na primeira vez que é pedida.
+    """
+    caminho = resolver(nome)
+    imutavel = armazem.e_objeto(nome)
+    etag = nome.split('.')[0]
+    download_name = None
+    
+    if perfil and perfil != 'impressao':
+        if perfil not in formatos.PERFIS:
+            abort(404)
+        caminho = formatos.derivada(nome, caminho, perfil)
+        etag = f'{etag}-{perfil}-{formatos.extensao(perfil)}'
+        download_name = os.path.basename(caminho)
+    
+    # O hash do conteúdo já é um ETag forte; arquivos antigos usam o do Werkzeug
+    resposta = send_file(caminho,
+                         as_attachment=download,
+                         download_name=download_name,
+                         etag=etag if imutavel else True,
+                         conditional=True,
+                         max_age=MAX_AGE_IMUTAVEL if imutavel else None)
+    if imutavel:
+        resposta.cache_control.public = True
+        resposta.cache_control.immutable = True
+    
+    # nginx serve o arquivo (e o Range) a partir do cabeçalho; o worker só responde os cabeçalhos
+    if MODO_SENDFILE == 'x-accel' and resposta.status_code in (200, 206):
+        relativo = os.path.relpath(caminho, 'static').replace(os.sep, '/')
+        resposta.headers['X-Accel-Redirect'] = PREFIXO_X_ACCEL.rstrip('/') + '/' + relativo
+        resposta.status_code = 200
+        resposta.close()
+        resposta.response = []
+        resposta.direct_passthrough = False
+        for cabecalho in ('Content-Length', 'Content-Range'):
+            resposta.headers.pop(cabecalho, None)
+    
+    return resposta
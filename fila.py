@@ -0,0 +1,277 @@
+import json
+import multiprocessing
+import os
+import sqlite3
+import threading
+import time
+
+import armazem
+import banco
+import cache_renders
+import formatos
+import motor
+from coordenadas import area_foto_template
+from psd_manager import carregar_compilado, gerar_simulacao
+
+# Estados de uma tarefa de geração
+NA_FILA = 'na_fila'
+EXECUTANDO = 'executando'
+CONCLUIDO = 'concluido'
+FALHOU = 'falhou'
+
+# Threads que despacham tarefas para o motor (por processo web)
+FILA_WORKERS = int(os.environ.get('OAB_FILA_WORKERS', max(motor.RENDER_WORKERS, 2)))
+
+# Intervalo de verificação de tarefas enfileiradas por outros processos
+INTERVALO_POLL = float(os.environ.get('OAB_FILA_POLL', '1.0'))
+
+# Tarefas "executando" há mais tempo que isso voltam para a fila (worker morreu)
+TIMEOUT_EXECUCAO_MIN = int(os.environ.get('OAB_FILA_TIMEOUT_MIN', '10'))
+
+# Frequência da recuperação de tarefas abandonadas (segundos, por processo)
+INTERVALO_RECUPERACAO = 60
+
+_db_path = None
+_pid = None
+_ultima_recuperacao = 0.0
+_evento = threading.Event()
+_iniciar_lock = threading.Lock()
+
+def criar_tabela(c):
+    """Cria a tabela de tarefas (chamado pelo init_db do app)"""
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS tarefas (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            status TEXT DEFAULT 'na_fila',
+            dados TEXT,
+            foto TEXT,
+            frente TEXT,
+            verso TEXT,
+            erro TEXT,
+            historico_id INTEGER,
+            criado TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            atualizado TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_tarefas_status ON tarefas (status, id)")
+
+def _chave_render(db_path, dados, foto_nome):
+    """Chave do cache de renderizações para a configuração atual"""
+    config = banco.obter_config(db_path)
+    if not config['versao_frente'] or not config['versao_verso']:
+        return None
+    
+    area = area_foto_template(config, carregar_compilado('frente', config['versao_frente'])[1])
+    return cache_renders.chave_render(config, banco.listar_campos(db_path=db_path), area, dados, foto_nome)
+
+def enfileirar(db_path, dados, foto_nome=None):
+    """Cria uma tarefa de geração e acorda os workers. Retorna o id.
+    
+    Se a mesma carteirinha já foi renderizada (reimpressão, envio repetido),
+    a tarefa nasce concluída com os arquivos existentes.
+    """
+    iniciar(db_path)
+    
+    dados = cache_renders.normalizar_dados(dados)
+    chave = _chave_render(db_path, dados, foto_nome)
+    
+    with banco.conectar(db_path) as conn:
+        tarefa_id = conn.execute("INSERT INTO tarefas (status, dados, foto) VALUES (?, ?, ?)",
+                                 (NA_FILA, json.dumps(dados, ensure_ascii=False), foto_nome)).lastrowid
+        
+        acerto = cache_renders.buscar(chave, conn=conn)
+        if acerto:
+            _concluir(conn.cursor(), tarefa_id, dados, foto_nome, *acerto)
+            return tarefa_id
+    
+    _evento.set()
+    return tarefa_id
+
+def obter_tarefa(db_path, tarefa_id):
+    """Retorna o estado de uma tarefa como dicionário (ou None)"""
+    c = banco.conectar(db_path).cursor()
+    c.row_factory = sqlite3.Row
+    c.execute("SELECT * FROM tarefas WHERE id = ?", (tarefa_id,))
+    row = c.fetchone()
+    
+    # Posição na fila para tarefas ainda não iniciadas
+    posicao = None
+    if row and row['status'] == NA_FILA:
+        c.execute("SELECT COUNT(*) FROM tarefas WHERE status = ? AND id < ?", (NA_FILA, tarefa_id))
+        posicao = c.fetchone()[0] + 1
+    
+    if not row:
+        return None
+    
+    dados = json.loads(row['dados'] or '{}')
+    return {
+        'id': row['id'],
+        'status': row['status'],
+        'nome': dados.get('Nome', 'Sem nome'),
+        'rg': dados.get('RG', 'Sem RG'),
+        'frente': row['frente'],
+        'verso': row['verso'],
+        'erro': row['erro'],
+        'posicao': posicao,
+        'criado': row['criado'],
+        'atualizado': row['atualizado']
+    }
+
+def _recuperar_abandonadas(conn):
+    """Devolve à fila as tarefas "executando" há mais de TIMEOUT_EXECUCAO_MIN (processo que morreu)"""
+    with conn:
+        conn.execute('''
+            UPDATE tarefas SET status = ?
+            WHERE status = ? AND atualizado < datetime('now', ?)
+        ''', (NA_FILA, EXECUTANDO, f'-{TIMEOUT_EXECUCAO_MIN} minutes'))
+
+def _reservar(c):
+    """Marca a próxima tarefa da fila como executando (atômico entre processos)"""
+    global _ultima_recuperacao
+    
+    # O substituto de um worker morto sobe antes do timeout: a recuperação é periódica
+    if time.monotonic() - _ultima_recuperacao >= INTERVALO_RECUPERACAO:
+        _ultima_recuperacao = time.monotonic()
+        _recuperar_abandonadas(c.connection)
+    
+    while True:
+        c.execute("SELECT id FROM tarefas WHERE status = ? ORDER BY id LIMIT 1", (NA_FILA,))
+        row = c.fetchone()
+        if not row:
+            return None
+        
+        c.execute('''
+            UPDATE tarefas SET status = ?, atualizado = CURRENT_TIMESTAMP
+            WHERE id = ? AND status = ?
+        ''', (EXECUTANDO, row[0], NA_FILA))
+        c.connection.commit()
+        
+        # Outro worker pegou antes: tentar a próxima
+        if c.rowcount == 1:
+            return row[0]
+
+def _executar(c, tarefa_id):
+    """Renderiza frente e verso de uma tarefa e registra no histórico"""
+    c.execute("SELECT dados, foto FROM tarefas WHERE id = ?", (tarefa_id,))
+    dados_json, foto_nome = c.fetchone()
+    dados = json.loads(dados_json or '{}')
+    
+    config = banco.obter_config(_db_path)
+    campos = banco.listar_campos(db_path=_db_path)
+    
+    # Envio duplicado que ficou na fila enquanto o primeiro renderizava
+    chave = _chave_render(_db_path, dados, foto_nome)
+    acerto = cache_renders.buscar(chave, conn=c.connection, contar_falha=False)
+    if acerto:
+        _concluir(c, tarefa_id, dados, foto_nome, *acerto)
+        c.connection.commit()
+        return
+    
+    versao_frente, versao_verso = config['versao_frente'], config['versao_verso']
+    compilado = bool(versao_frente and versao_verso)
+    
+    # Verso sem campos por membro: o mesmo objeto para todos (renderizado uma vez por versão).
+    # Commit já: a transação não pode segurar o lock de escrita durante a renderização
+    verso_nome = cache_renders.lado_fixo('verso', versao_verso if compilado else None, campos, conn=c.connection)
+    c.connection.commit()
+    
+    # Renderizar em temporários; o nome final é o hash do conteúdo
+    frente_path = armazem.temporario('png')
+    verso_path = armazem.temporario('png')
+    
+    # Versões de tela codificadas no motor junto com a de impressão (imagem já em memória)
+    frente_tela = armazem.temporario(formatos.extensao('tela'))
+    verso_tela = armazem.temporario(formatos.extensao('tela'))
+    
+    try:
+        if compilado:
+            # Frente e verso em paralelo no motor (templates compilados)
+            # Área capturada na preview, convertida para a resolução do template
+            area = area_foto_template(config, carregar_compilado('frente', versao_frente)[1])
+            foto_path = armazem.caminho_arquivo(foto_nome, 'fotos') if foto_nome else None
+            
+            motor.iniciar_motor([('frente', versao_frente), ('verso', versao_verso)])
+            futuros = [motor.submeter('frente', versao_frente, dados, campos, frente_path, foto_path, area, frente_tela)]
+            if not verso_nome:
+                futuros.append(motor.submeter('verso', versao_verso, dados, campos, verso_path, tela_path=verso_tela))
+            motor.aguardar(futuros)
+        else:
+            # PSDs enviados antes da compilação usam a simulação
+            gerar_simulacao(dados, config['area_foto'], frente_path, None if verso_nome else verso_path)
+        
+        frente_nome = armazem.importar(frente_path, 'png', conn=c.connection)
+        publicar = [(frente_tela, frente_nome)]
+        if not verso_nome:
+            verso_nome = armazem.importar(verso_path, 'png', conn=c.connection)
+            publicar.append((verso_tela, verso_nome))
+        
+        for tela, nome in publicar:
+            if os.path.getsize(tela):
+                formatos.publicar_derivada(tela, nome, 'tela')
+    finally:
+        armazem.descartar(frente_path, verso_path, frente_tela, verso_tela)
+    
+    cache_renders.guardar(chave, frente_nome, verso_nome, conn=c.connection)
+    _concluir(c, tarefa_id, dados, foto_nome, frente_nome, verso_nome)
+    c.connection.commit()
+
+def _concluir(c, tarefa_id, dados, foto_nome, frente_nome, verso_nome):
+    """Registra no histórico e marca a tarefa como concluída (na transação do chamador)"""
+    historico_id = banco.registrar_historico(dados.get('Nome', 'Sem nome'), dados.get('RG', 'Sem RG'),
+                                             foto_nome, frente_nome, verso_nome, conn=c.connection)
+    
+    c.execute('''
+        UPDATE tarefas SET status = ?, frente = ?, verso = ?, historico_id = ?, atualizado = CURRENT_TIMESTAMP
+        WHERE id = ?
+    ''', (CONCLUIDO, frente_nome, verso_nome, historico_id, tarefa_id))
+
+def _worker():
+    """Loop de uma thread da fila: reserva, executa, repete"""
+    conn = banco.conectar(_db_path)
+    c = conn.cursor()
+    
+    while True:
+        try:
+            tarefa_id = _reservar(c)
+        except sqlite3.Error as e:
+            print(f"Erro ao ler fila de tarefas: {e}")
+            tarefa_id = None
+        
+        if tarefa_id is None:
+            _evento.wait(INTERVALO_POLL)
+            _evento.clear()
+            continue
+        
+        try:
+            _executar(c, tarefa_id)
+        except Exception as e:
+            print(f"Erro na tarefa {tarefa_id}: {e}")
+            # Falha ao registrar a falha (ex.: lock) não pode matar a thread; a recuperação devolve a tarefa à fila
+            try:
+                conn.rollback()
+                c.execute('''
+                    UPDATE tarefas SET status = ?, erro = ?, atualizado = CURRENT_TIMESTAMP
+                    WHERE id = ?
+                ''', (FALHOU, str(e), tarefa_id))
+                conn.commit()
+            except sqlite3.Error as erro:
+                print(f"Erro ao registrar falha da tarefa {tarefa_id}: {erro}")
+                conn.rollback()
+
+def iniciar(db_path):
+    """Inicia as threads da fila neste processo (idempotente, seguro após fork)"""
+    global _db_path, _pid
+    
+    # Processos do motor (spawn) reimportam o app, mas não despacham tarefas
+    if multiprocessing.parent_process() is not None:
+        return
+    
+    with _iniciar_lock:
+        if _pid == os.getpid():
+            return
+        
+        _db_path = db_path
+        _pid = os.getpid()
+        
+        for i in range(FILA_WORKERS):
+            threading.Thread(target=_worker, name=f'fila-{i}', daemon=True).start()
@@ -0,0 +1,154 @@
+import math
+import os
+import re
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+
+from PIL import Image, ImageDraw, ImageFont
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Pastas onde procurar fontes (a do projeto tem prioridade)
+PASTAS_FONTES = [
+    os.path.join(BASE_DIR, 'static', 'fonts'),
+    '/usr/share/fonts',
+    '/usr/local/share/fonts',
+    os.path.expanduser('~/.fonts'),
+    '/Library/Fonts',
+    '/System/Library/Fonts',
+    os.path.join(os.environ.get('WINDIR', 'C:\\Windows'), 'Fonts')
+]
+
+# Fontes usadas quando a família do PSD não está instalada
+FONTES_PADRAO = ['arial', 'dejavusans', 'liberationsans']
+
+# Quantidade de medições de texto memorizadas por processo
+CACHE_LARGURAS = int(os.environ.get('OAB_CACHE_LARGURAS', '20000'))
+
+# Máscaras de texto já rasterizadas (por processo): valores repetidos não passam de novo pelo FreeType
+CACHE_MASCARAS_MAX_BYTES = int(os.environ.get('OAB_CACHE_MASCARAS_MB', '64')) * 1024 * 1024
+
+_mascaras = OrderedDict()
+_mascaras_bytes = 0
+_mascaras_lock = threading.Lock()
+_contadores_mascaras = {'acertos': 0, 'falhas': 0}
+
+_indice = None
+_indice_lock = threading.Lock()
+
+def _normalizar(nome):
+    """'Arial-BoldMT' -> 'arialbold', 'DejaVuSans.ttf' -> 'dejavusans'"""
+    nome = os.path.splitext(nome)[0].lower()
+    nome = re.sub(r'[^a-z0-9]', '', nome)
+    return re.sub(r'(mt|ps|regular|roman)$', '', nome)
+
+def _indexar_fontes():
+    """Mapeia nome normalizado -> caminho de todas as fontes encontradas (uma vez)"""
+    global _indice
+    
+    with _indice_lock:
+        if _indice is None:
+            indice = {}
+            for pasta in PASTAS_FONTES:
+                for raiz, _, arquivos in os.walk(pasta):
+                    for arquivo in arquivos:
+                        if arquivo.lower().endswith(('.ttf', '.otf', '.ttc')):
+                            indice.setdefault(_normalizar(arquivo), os.path.join(raiz, arquivo))
+            _indice = indice
+        return _indice
+
+@lru_cache(maxsize=None)
+def resolver_fonte(familia=None):
+    """Caminho do arquivo da família pedida (ou de uma fonte padrão); None se nada existir"""
+    indice = _indexar_fontes()
+    
+    for nome in ([familia] if familia else []) + FONTES_PADRAO:
+        caminho = indice.get(_normalizar(nome))
+        if caminho:
+            return caminho
+    
+    return None
+
+@lru_cache(maxsize=256)
+def carregar_fonte(familia=None, tamanho=24):
+    """Face FreeType carregada uma única vez por (família, tamanho) neste processo"""
+    caminho = resolver_fonte(familia)
+    if caminho:
+        return ImageFont.truetype(caminho, tamanho)
+    
+    # Último recurso: busca do próprio Pillow e depois a fonte bitmap
+    try:
+        return ImageFont.truetype("arial.ttf", tamanho)
+    except OSError:
+        return ImageFont.load_default()
+
+@lru_cache(maxsize=CACHE_LARGURAS)
+def largura_texto(texto, familia=None, tamanho=24):
+    """Largura em pixels do texto, memorizada para valores repetidos"""
+    return carregar_fonte(familia, tamanho).getlength(texto)
+
+def _rasterizar(texto, fracao, familia, tamanho):
+    """Máscara L do texto e o canto dela em relação à origem inteira.
+    
+    O canto começa no máximo na origem (com 1px de folga), então a fração
+    da origem fica em coordenadas positivas e o antialiasing sai igual ao
+    de draw.text no canvas inteiro.
+    """
+    font = carregar_fonte(familia, tamanho)
+    gx1, gy1, gx2, gy2 = font.getbbox(texto)
+    x1, y1 = min(gx1, 0) - 1, min(gy1, 0) - 1
+    mascara = Image.new('L', (gx2 + 1 - x1, gy2 + 1 - y1))
+    ImageDraw.Draw(mascara).text((fracao[0] - x1, fracao[1] - y1), texto, fill=255, font=font)
+    return (x1, y1), mascara
+
+def mascara_texto(texto, origem, familia=None, tamanho=24):
+    """Máscara do texto desenhado em origem: ((x, y) do canto no canvas, Image L).
+    
+    Cache LRU por (família, tamanho, texto, fração da origem): a cor só entra
+    na colagem e a caixa do campo só muda a parte inteira da origem, então a
+    mesma máscara serve para todos os cartões com o mesmo valor.
+    """
+    global _mascaras_bytes
+    fracao = (math.modf(origem[0])[0], math.modf(origem[1])[0])
+    chave = (familia, tamanho, texto, fracao)
+    
+    with _mascaras_lock:
+        item = _mascaras.get(chave)
+        if item is not None:
+            _mascaras.move_to_end(chave)
+            _contadores_mascaras['acertos'] += 1
+        else:
+            _contadores_mascaras['falhas'] += 1
+    
+    if item is None:
+        item = _rasterizar(texto, fracao, familia, tamanho)
+        tamanho_bytes = item[1].width * item[1].height
+        with _mascaras_lock:
+            if chave not in _mascaras and tamanho_bytes <= CACHE_MASCARAS_MAX_BYTES:
+                _mascaras[chave] = item
+                _mascaras_bytes += tamanho_bytes
+                while _mascaras_bytes > CACHE_MASCARAS_MAX_BYTES:
+                    _, (_, antiga) = _mascaras.popitem(last=False)
+                    _mascaras_bytes -= antiga.width * antiga.height
+    
+    (dx, dy), mascara = item
+    return (int(origem[0]) + dx, int(origem[1]) + dy), mascara
+
+def contadores_mascaras():
+    """Acertos e falhas do cache de máscaras neste processo (acumulados)"""
+    with _mascaras_lock:
+        return dict(_contadores_mascaras)
+
+def estatisticas_mascaras():
+    """Acertos, falhas, taxa de acerto, entradas e bytes do cache de máscaras deste processo"""
+    with _mascaras_lock:
+        acertos, falhas = _contadores_mascaras['acertos'], _contadores_mascaras['falhas']
+        return {
+            'acertos': acertos,
+            'falhas': falhas,
+            'taxa_acerto': acertos / (acertos + falhas) if acertos + falhas else 0.0,
+            'entradas': len(_mascaras),
+            'bytes': _mascaras_bytes,
+            'limite_bytes': CACHE_MASCARAS_MAX_BYTES
+        }
@@ -0,0 +1,82 @@
+import os
+import tempfile
+
+from PIL import Image, features
+
+# Derivadas das saídas (tela, TIFF, ...) por nome do arquivo de origem; são recriáveis
+PASTA_DERIVADAS = os.path.join('static', 'derivadas')
+
+# Compressão zlib do PNG de impressão (0-9): 9 é várias vezes mais lento para poucos % a menos
+PNG_COMPRESSAO = int(os.environ.get('OAB_PNG_COMPRESSAO', '3'))
+
+# Versão de tela exibida no resultado: webp ou jpeg, reduzida para caber em TELA_MAX pixels
+FORMATO_TELA = os.environ.get('OAB_FORMATO_TELA', 'webp' if features.check('webp') else 'jpeg').lower()
+TELA_MAX = int(os.environ.get('OAB_TELA_MAX', '1000'))
+QUALIDADE_TELA = int(os.environ.get('OAB_QUALIDADE_TELA', '85'))
+
+# Perfis de saída: formato, redução (None = resolução total) e opções do codificador
+PERFIS = {
+    'impressao': {'formato': 'png', 'tamanho_max': None},
+    'tiff': {'formato': 'tiff', 'tamanho_max': None},
+    'jpeg': {'formato': 'jpeg', 'tamanho_max': None, 'qualidade': 95},
+    'tela': {'formato': FORMATO_TELA, 'tamanho_max': TELA_MAX, 'qualidade': QUALIDADE_TELA},
+    'miniatura': {'formato': 'png', 'tamanho_max': 320, 'quantizar': True}
+}
+
+EXTENSOES = {'png': 'png', 'jpeg': 'jpg', 'webp': 'webp', 'tiff': 'tif'}
+
+def extensao(perfil):
+    return EXTENSOES[PERFIS[perfil]['formato']]
+
+def salvar(img, destino, formato='png', qualidade=None, quantizar=False):
+    """Codifica img em destino (caminho ou arquivo) com as opções de cada formato"""
+    if formato == 'png':
+        if quantizar:
+            # Paleta de 256 cores: previews 3-4x menores, sem diferença visível na tela
+            img = img.convert('RGB').quantize(256, method=Image.Quantize.FASTOCTREE)
+        img.save(destino, 'PNG', compress_level=PNG_COMPRESSAO)
+    elif formato == 'jpeg':
+        # 4:4:4 mantém o texto fino sem franjas de cor
+        img.convert('RGB').save(destino, 'JPEG', quality=qualidade or 90, subsampling=0, progressive=True)
+    elif formato == 'webp':
+        img.save(destino, 'WEBP', quality=qualidade or 85, method=4)
+    elif formato == 'tiff':
+        img.save(destino, 'TIFF', compression='tiff_adobe_deflate' if features.check('libtiff') else None)
+    else:
+        raise ValueError(f"Formato de saída desconhecido: {formato}")
+
+def salvar_perfil(img, destino, perfil):
+    """Reduz (se o perfil pedir) e codifica img conforme um perfil de PERFIS"""
+    opcoes = PERFIS[perfil]
+    if opcoes['tamanho_max'] and max(img.size) > opcoes['tamanho_max']:
+        img = img.copy()
+        img.thumbnail((opcoes['tamanho_max'], opcoes['tamanho_max']), Image.Resampling.LANCZOS)
+    salvar(img, destino, opcoes['formato'], opcoes.get('qualidade'), opcoes.get('quantizar', False))
+
+def caminho_derivada(nome, perfil, pasta=PASTA_DERIVADAS):
+    """Caminho da derivada de uma saída (nome do objeto ou arquivo antigo) em um perfil"""
+    return os.path.join(pasta, f"{nome.rsplit('.', 1)[0]}_{perfil}.{extensao(perfil)}")
+
+def publicar_derivada(tmp, nome, perfil, pasta=PASTA_DERIVADAS):
+    """Move uma derivada já codificada (ex.: pelo motor) para o seu caminho final"""
+    destino = caminho_derivada(nome, perfil, pasta)
+    os.makedirs(pasta, exist_ok=True)
+    os.replace(tmp, destino)
+    return destino
+
+def derivada(nome, origem, perfil, pasta=PASTA_DERIVADAS):
+    """Caminho da derivada, codificada a partir da origem na primeira vez que é pedida"""
+    destino = caminho_derivada(nome, perfil, pasta)
+    if os.path.exists(destino):
+        return destino
+    
+    os.makedirs(pasta, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=pasta, prefix='.', suffix=f'.{extensao(perfil)}')
+    try:
+        with os.fdopen(fd, 'wb') as f, Image.open(origem) as img:
+            salvar_perfil(img, f, perfil)
+        os.replace(tmp, destino)
+    except Exception:
+        os.remove(tmp)
+        raise
+    return destino
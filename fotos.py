@@ -0,0 +1,76 @@
+import hashlib
+import os
+import tempfile
+from functools import lru_cache
+
+from PIL import Image, ImageOps
+
+# Derivadas já recortadas e redimensionadas para a área da foto
+PASTA_NORMALIZADAS = os.path.join('static', 'fotos', 'normalizadas')
+
+# Ponto de equilíbrio do recorte (x, y): um pouco acima do centro, onde fica o rosto
+CENTRO_RECORTE = (0.5, 0.4)
+
+@lru_cache(maxsize=1024)
+def _hash_conteudo(caminho, mtime_ns, tamanho):
+    sha = hashlib.sha256()
+    with open(caminho, 'rb') as f:
+        for bloco in iter(lambda: f.read(1024 * 1024), b''):
+            sha.update(bloco)
+    return sha.hexdigest()
+
+def hash_foto(caminho):
+    """SHA-256 do arquivo original (memorizado enquanto o arquivo não mudar)"""
+    st = os.stat(caminho)
+    return _hash_conteudo(os.path.abspath(caminho), st.st_mtime_ns, st.st_size)
+
+def normalizar_foto(origem, tamanho):
+    """Decodifica, orienta e recorta a foto para exatamente tamanho (largura, altura).
+    
+    JPEGs são decodificados em escala reduzida (draft) quando a área é bem
+    menor que a foto da câmera, o que evita descomprimir a imagem inteira.
+    """
+    foto = Image.open(origem)
+    
+    # draft escolhe a maior redução (1/2, 1/4, 1/8) que ainda cobre o tamanho pedido
+    # (orientações EXIF giradas trocam largura e altura)
+    orientacao = foto.getexif().get(0x0112, 1)
+    alvo = tamanho if orientacao in (1, 2, 3, 4) else tamanho[::-1]
+    foto.draft('RGB', alvo)
+    
+    foto = ImageOps.exif_transpose(foto).convert('RGB')
+    return ImageOps.fit(foto, tamanho, Image.Resampling.LANCZOS, centering=CENTRO_RECORTE)
+
+def foto_normalizada(foto_path, tamanho, pasta=PASTA_NORMALIZADAS):
+    """Foto pronta para colar na área, reaproveitando a derivada em disco.
+    
+    A derivada é identificada pelo hash do original e pelo tamanho da área,
+    então reimpressões, lotes reprocessados e outros workers não voltam a
+    decodificar a foto da câmera. Arquivos abertos (sem caminho) são
+    apenas normalizados.
+    """
+    largura, altura = tamanho
+    if not isinstance(foto_path, (str, os.PathLike)):
+        return normalizar_foto(foto_path, tamanho)
+    
+    derivada = os.path.join(pasta, f"{hash_foto(foto_path)}_{largura}x{altura}.png")
+    if os.path.exists(derivada):
+        try:
+            with Image.open(derivada) as img:
+                return img.convert('RGB')
+        except OSError as e:
+            print(f"Erro ao ler foto normalizada {derivada}: {e}")
+    
+    foto = normalizar_foto(foto_path, tamanho)
+    
+    # Gravação atômica: outro worker pode estar gerando a mesma derivada
+    try:
+        os.makedirs(pasta, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=pasta, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            foto.save(f, 'PNG')
+        os.replace(tmp, derivada)
+    except OSError as e:
+        print(f"Erro ao salvar foto normalizada: {e}")
+    
+    return foto
@@ -0,0 +1,229 @@
+import os
+import struct
+import zlib
+
+from PIL import Image
+
+# Folha A4 e cartão CR80 (85,60 x 53,98 mm) em pontos PDF
+PONTOS_POR_MM = 72 / 25.4
+A4 = (210 * PONTOS_POR_MM, 297 * PONTOS_POR_MM)
+CR80 = (85.60 * PONTOS_POR_MM, 53.98 * PONTOS_POR_MM)
+
+# Imposição padrão: 2 colunas x 5 linhas = 10 cartões por folha
+COLUNAS = int(os.environ.get('OAB_PDF_COLUNAS', '2'))
+LINHAS = int(os.environ.get('OAB_PDF_LINHAS', '5'))
+ESPACAMENTO_MM = float(os.environ.get('OAB_PDF_ESPACAMENTO_MM', '0'))
+
+def _chunks_png(caminho):
+    """Lê os chunks de um PNG: (IHDR, dados IDAT concatenados) ou None se não for PNG"""
+    with open(caminho, 'rb') as f:
+        if f.read(8) != b'\x89PNG\r\n\x1a\n':
+            return None
+        ihdr = None
+        idat = []
+        while True:
+            cabecalho = f.read(8)
+            if len(cabecalho) < 8:
+                break
+            tamanho, tipo = struct.unpack('>I4s', cabecalho)
+            dados = f.read(tamanho)
+            f.read(4)  # CRC
+            if tipo == b'IHDR':
+                ihdr = struct.unpack('>IIBBBBB', dados)
+            elif tipo == b'IDAT':
+                idat.append(dados)
+            elif tipo == b'IEND':
+                break
+    return ihdr, b''.join(idat)
+
+def _imagem_pdf(caminho):
+    """Dicionário e dados do XObject de imagem.
+    
+    PNG RGB/cinza de 8 bits (não entrelaçado) e JPEG são embutidos como estão
+    (FlateDecode com preditor PNG / DCTDecode), sem decodificar nem recomprimir.
+    Os demais formatos são convertidos para RGB e comprimidos com zlib.
+    """
+    png = _chunks_png(caminho)
+    if png and png[0]:
+        largura, altura, bits, tipo_cor, _, _, entrelacado = png[0]
+        if bits == 8 and tipo_cor in (0, 2) and not entrelacado:
+            cores = 3 if tipo_cor == 2 else 1
+            espaco = '/DeviceRGB' if cores == 3 else '/DeviceGray'
+            dicionario = (f'/Width {largura} /Height {altura} /ColorSpace {espaco} /BitsPerComponent 8 '
+                          f'/Filter /FlateDecode /DecodeParms << /Predictor 15 /Colors {cores} '
+                          f'/BitsPerComponent 8 /Columns {largura} >>')
+            return dicionario, png[1], (largura, altura)
+    
+    with Image.open(caminho) as img:
+        if img.format == 'JPEG' and img.mode in ('RGB', 'L', 'CMYK'):
+            espaco = {'RGB': '/DeviceRGB', 'L': '/DeviceGray', 'CMYK': '/DeviceCMYK'}[img.mode]
+            decode = ' /Decode [1 0 1 0 1 0 1 0]' if img.mode == 'CMYK' else ''
+            with open(caminho, 'rb') as f:
+                dados = f.read()
+            dicionario = (f'/Width {img.width} /Height {img.height} /ColorSpace {espaco} '
+                          f'/BitsPerComponent 8 /Filter /DCTDecode{decode}')
+            return dicionario, dados, img.size
+        
+        rgb = img.convert('RGB')
+        dicionario = (f'/Width {rgb.width} /Height {rgb.height} /ColorSpace /DeviceRGB '
+                      f'/BitsPerComponent 8 /Filter /FlateDecode')
+        return dicionario, zlib.compress(rgb.tobytes(), 6), rgb.size
+
+class FolhasPDF:
+    """Escritor de PDF em fluxo: N cartões por folha A4, frente e verso alternados.
+    
+    Cada chamada de adicionar()/finalizar() devolve os bytes prontos para
+    enviar; só a folha em montagem (no máximo colunas x linhas cartões) e a
+    tabela de offsets ficam em memória. A página de versos espelha as
+    colunas (duplex pela borda longa) ou as linhas (borda curta), para que
+    cada verso caia atrás da sua frente.
+    """
+    
+    def __init__(self, colunas=COLUNAS, linhas=LINHAS, espacamento_mm=ESPACAMENTO_MM, duplex='longa'):
+        self.colunas = colunas
+        self.linhas = linhas
+        self.duplex = duplex
+        self.espacamento = espacamento_mm * PONTOS_POR_MM
+        
+        # Grade centralizada na folha
+        largura_grade = colunas * CR80[0] + (colunas - 1) * self.espacamento
+        altura_grade = linhas * CR80[1] + (linhas - 1) * self.espacamento
+        self.margem_x = (A4[0] - largura_grade) / 2
+        self.margem_y = (A4[1] - altura_grade) / 2
+        if colunas < 1 or linhas < 1 or self.margem_x < 0 or self.margem_y < 0:
+            raise ValueError(f"{colunas}x{linhas} cartões CR80 não cabem em uma folha A4")
+        if duplex not in ('longa', 'curta'):
+            raise ValueError("Duplex deve ser 'longa' ou 'curta'")
+        
+        self.offset = 0
+        self.offsets = {}
+        self.proximo_objeto = 3  # 1 = catálogo, 2 = árvore de páginas
+        self.paginas = []
+        self.imagens = {}  # caminho -> (objeto, tamanho): versos idênticos são embutidos uma vez
+        self.folha = []
+        self.iniciado = False
+    
+    def _novo_objeto(self):
+        numero = self.proximo_objeto
+        self.proximo_objeto += 1
+        return numero
+    
+    def _escrever(self, dados):
+        self.offset += len(dados)
+        return dados
+    
+    def _objeto(self, numero, corpo, fluxo=None):
+        self.offsets[numero] = self.offset
+        if fluxo is None:
+            return self._escrever(f'{numero} 0 obj\n{corpo}\nendobj\n'.encode('latin-1'))
+        cabecalho = f'{numero} 0 obj\n<< {corpo} /Length {len(fluxo)} >>\nstream\n'.encode('latin-1')
+        return self._escrever(cabecalho + fluxo + b'\nendstream\nendobj\n')
+    
+    def _cabecalho(self):
+        if self.iniciado:
+            return b''
+        self.iniciado = True
+        return self._escrever(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+    
+    def _imagem(self, caminho, partes):
+        chave = os.path.abspath(caminho)
+        if chave not in self.imagens:
+            dicionario, dados, tamanho = _imagem_pdf(caminho)
+            numero = self._novo_objeto()
+            partes.append(self._objeto(numero, f'/Type /XObject /Subtype /Image {dicionario}', dados))
+            self.imagens[chave] = (numero, tamanho)
+        return self.imagens[chave]
+    
+    def _posicao(self, indice, verso):
+        linha, coluna = divmod(indice, self.colunas)
+        if verso and self.duplex == 'longa':
+            coluna = self.colunas - 1 - coluna
+        elif verso and self.duplex == 'curta':
+            linha = self.linhas - 1 - linha
+        x = self.margem_x + coluna * (CR80[0] + self.espacamento)
+        # PDF tem a origem embaixo: a primeira linha fica no topo
+        y = A4[1] - self.margem_y - (linha + 1) * CR80[1] - linha * self.espacamento
+        return x, y
+    
+    def _pagina(self, caminhos, verso):
+        partes = []
+        recursos = []
+        comandos = []
+        
+        for indice, caminho in enumerate(caminhos):
+            if not caminho:
+                continue
+            numero, (largura, altura) = self._imagem(caminho, partes)
+            x, y = self._posicao(indice, verso)
+            
+            # Ajustar ao cartão mantendo a proporção, centralizado
+            escala = min(CR80[0] / largura, CR80[1] / altura)
+            w, h = largura * escala, altura * escala
+            x += (CR80[0] - w) / 2
+            y += (CR80[1] - h) / 2
+            
+            recursos.append(f'/Im{numero} {numero} 0 R')
+            comandos.append(f'q {w:.3f} 0 0 {h:.3f} {x:.3f} {y:.3f} cm /Im{numero} Do Q')
+        
+        conteudo = zlib.compress('\n'.join(comandos).encode('latin-1'))
+        numero_conteudo = self._novo_objeto()
+        partes.append(self._objeto(numero_conteudo, '/Filter /FlateDecode', conteudo))
+        
+        numero_pagina = self._novo_objeto()
+        partes.append(self._objeto(numero_pagina,
+                                   f'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {A4[0]:.2f} {A4[1]:.2f}] '
+                                   f'/Resources << /XObject << {" ".join(recursos)} >> >> '
+                                   f'/Contents {numero_conteudo} 0 R >>'))
+        self.paginas.append(numero_pagina)
+        return b''.join(partes)
+    
+    def _fechar_folha(self):
+        if not self.folha:
+            return b''
+        frentes = [frente for frente, _ in self.folha]
+        versos = [verso for _, verso in self.folha]
+        self.folha = []
+        
+        dados = self._pagina(frentes, verso=False)
+        if any(versos):
+            dados += self._pagina(versos, verso=True)
+        return dados
+    
+    def adicionar(self, frente_path, verso_path=None):
+        """Coloca um cartão na folha atual; devolve os bytes das páginas que ficaram prontas"""
+        dados = self._cabecalho()
+        self.folha.append((frente_path, verso_path))
+        if len(self.folha) == self.colunas * self.linhas:
+            dados += self._fechar_folha()
+        return dados
+    
+    def finalizar(self):
+        """Fecha a última folha e escreve catálogo, árvore de páginas e xref"""
+        dados = self._cabecalho() + self._fechar_folha()
+        
+        kids = ' '.join(f'{numero} 0 R' for numero in self.paginas)
+        dados += self._objeto(2, f'<< /Type /Pages /Kids [{kids}] /Count {len(self.paginas)} >>')
+        dados += self._objeto(1, '<< /Type /Catalog /Pages 2 0 R >>')
+        
+        inicio_xref = self.offset
+        linhas = [f'xref\n0 {self.proximo_objeto}\n', '0000000000 65535 f \n']
+        for numero in range(1, self.proximo_objeto):
+            linhas.append(f'{self.offsets[numero]:010d} 00000 n \n')
+        linhas.append(f'trailer\n<< /Size {self.proximo_objeto} /Root 1 0 R >>\nstartxref\n{inicio_xref}\n%%EOF\n')
+        return dados + self._escrever(''.join(linhas).encode('latin-1'))
+
+def gerar_pdf(cartoes, **opcoes):
+    """Iterador de bytes do PDF para um iterável de (frente_path, verso_path).
+    
+    A imposição é validada aqui (ValueError), antes do primeiro byte enviado.
+    """
+    folhas = FolhasPDF(**opcoes)
+    
+    def blocos():
+        for frente_path, verso_path in cartoes:
+            dados = folhas.adicionar(frente_path, verso_path)
+            if dados:
+                yield dados
+        yield folhas.finalizar()
+    
+    return blocos()
@@ -0,0 +1,284 @@
+import argparse
+import csv
+import io
+import json
+import os
+import zipfile
+from collections import deque
+from itertools import chain
+
+import armazem
+import banco
+import cache_renders
+import motor
+from coordenadas import area_foto_template
+from impressao import FolhasPDF
+from psd_manager import carregar_compilado
+
+# Extensões de foto aceitas dentro do ZIP
+EXTENSOES_FOTO = ['png', 'jpg', 'jpeg', 'gif']
+
+# Linhas enviadas ao motor em uma só tarefa por lado (menos overhead por cartão)
+BLOCO_LOTE = int(os.environ.get('OAB_LOTE_BLOCO', '8'))
+
+# Linhas em renderização simultânea (limita memória e arquivos pendentes)
+JANELA_LOTE = max(2 * motor.RENDER_WORKERS, 4) * BLOCO_LOTE
+
+# Codificações tentadas em ordem: o Excel em pt-BR exporta CSV em cp1252; latin-1 aceita qualquer byte
+CODIFICACOES_ROSTER = ('utf-8-sig', 'cp1252', 'latin-1')
+
+def _linhas_texto(arquivo):
+    """Linhas do arquivo binário decodificadas, passando para a próxima codificação no primeiro erro"""
+    atual = 0
+    for bruta in arquivo:
+        while True:
+            try:
+                yield bruta.decode(CODIFICACOES_ROSTER[atual])
+                break
+            except UnicodeDecodeError:
+                atual += 1
+
+def ler_roster(arquivo, nome_arquivo):
+    """Lê um roster CSV ou JSON Lines e retorna um iterador de dicionários.
+    
+    Uma linha que não pode ser lida vem como a exceção (ValueError) no lugar
+    do dicionário, para falhar só essa linha no relatório do lote.
+    """
+    linhas = _linhas_texto(arquivo)
+    
+    if nome_arquivo.lower().endswith(('.jsonl', '.json', '.ndjson')):
+        for linha in linhas:
+            linha = linha.strip()
+            if linha:
+                try:
+                    yield json.loads(linha)
+                except ValueError as e:
+                    yield ValueError(f"JSON inválido: {e}")
+    else:
+        amostra = []
+        while sum(map(len, amostra)) < 4096:
+            linha = next(linhas, None)
+            if linha is None:
+                break
+            amostra.append(linha)
+        try:
+            dialeto = csv.Sniffer().sniff(''.join(amostra), delimiters=',;\t')
+        except csv.Error:
+            dialeto = csv.excel
+        
+        leitor = csv.DictReader(chain(amostra, linhas), dialect=dialeto)
+        while True:
+            try:
+                linha = next(leitor)
+            except StopIteration:
+                return
+            except csv.Error as e:
+                yield ValueError(f"CSV inválido: {e}")
+                continue
+            yield {k.strip(): (v or '').strip() if isinstance(v, str) else '' for k, v in linha.items() if k}
+
+def _indexar_fotos(fotos_zip):
+    """Mapeia o nome base (minúsculo) de cada foto do ZIP para a entrada"""
+    fotos = {}
+    if fotos_zip is None:
+        return fotos
+    
+    for info in fotos_zip.infolist():
+        nome = os.path.basename(info.filename)
+        if not info.is_dir() and nome.rsplit('.', 1)[-1].lower() in EXTENSOES_FOTO:
+            fotos[nome.lower()] = info
+    
+    return fotos
+
+def _valor_foto(linha):
+    for chave, valor in linha.items():
+        if chave.lower() == 'foto':
+            return valor
+    return None
+
+class _SaidaStream:
+    """Destino de escrita sem seek que acumula bytes para um gerador"""
+    
+    def __init__(self):
+        self.partes = []
+    
+    def write(self, dados):
+        self.partes.append(bytes(dados))
+        return len(dados)
+    
+    def flush(self):
+        pass
+    
+    def esvaziar(self):
+        partes, self.partes = self.partes, []
+        return partes
+
+def gerar_lote(linhas, fotos_zip, config, campos, db_path=None, formato='png'):
+    """Gera todas as carteirinhas do roster e produz um ZIP em blocos (gerador).
+    
+    formato='pdf' troca os PNGs por um carteirinhas.pdf pronto para impressão,
+    escrito folha a folha à medida que as linhas são concluídas.
+    Erros de uma linha não interrompem o lote: ficam em relatorio.csv no ZIP.
+    """
+    if not config['versao_frente'] or not config['versao_verso']:
+        raise ValueError("Templates não compilados. Reenvie os PSDs antes de gerar em lote.")
+    
+    area_foto = area_foto_template(config, carregar_compilado('frente', config['versao_frente'])[1])
+    fotos = _indexar_fotos(fotos_zip)
+    
+    relatorio = io.StringIO()
+    escritor = csv.writer(relatorio)
+    escritor.writerow(['linha', 'nome', 'status', 'frente', 'verso', 'erro'])
+    
+    motor.iniciar_motor([('frente', config['versao_frente']), ('verso', config['versao_verso'])])
+    
+    # Verso sem campos por membro: renderizado uma vez e referenciado por todas as linhas
+    verso_fixo = cache_renders.lado_fixo('verso', config['versao_verso'], campos, db_path=db_path)
+    
+    saida = _SaidaStream()
+    pendentes = deque()
+    
+    # Bloco em montagem: as linhas guardam a lista de Futures, preenchida no envio
+    bloco = []
+    futuros_bloco = []
+    
+    def enviar_bloco():
+        nonlocal bloco, futuros_bloco
+        if bloco:
+            futuros_bloco.append(
+                motor.submeter_bloco('frente', config['versao_frente'], campos,
+                                     [(linha, frente, foto, area_foto) for linha, frente, _, foto in bloco]))
+            if not verso_fixo:
+                futuros_bloco.append(
+                    motor.submeter_bloco('verso', config['versao_verso'], campos,
+                                         [(linha, verso, None, None) for linha, _, verso, _ in bloco]))
+        bloco, futuros_bloco = [], []
+    folhas = FolhasPDF() if formato == 'pdf' else None
+    pdf = None
+    
+    def concluir(numero, nome, rg, foto_nome, frente_path, verso_path, futuros, erro=None, chave=None, acerto=None):
+        try:
+            if erro:
+                raise erro
+            
+            with banco.conectar(db_path) as conn:
+                if acerto:
+                    # Linha idêntica já renderizada (lote reenviado)
+                    frente_nome, verso_nome = acerto
+                else:
+                    futuros, indice = futuros
+                    for erros in motor.aguardar(futuros):
+                        if erros[indice]:
+                            raise RuntimeError(erros[indice])
+                    
+                    # Publicar no armazém (reimpressões idênticas viram o mesmo objeto)
+                    frente_nome = armazem.importar(frente_path, 'png', conn=conn)
+                    verso_nome = verso_fixo or armazem.importar(verso_path, 'png', conn=conn)
+                    cache_renders.guardar(chave, frente_nome, verso_nome, conn=conn)
+                
+                banco.registrar_historico(nome, rg, foto_nome, frente_nome, verso_nome, conn=conn)
+            
+            if folhas:
+                pdf.write(folhas.adicionar(armazem.caminho(frente_nome), armazem.caminho(verso_nome)))
+            else:
+                zf.write(armazem.caminho(frente_nome), f'{numero:05d}_frente.png')
+                zf.write(armazem.caminho(verso_nome), f'{numero:05d}_verso.png')
+            
+            escritor.writerow([numero, nome, 'ok', frente_nome, verso_nome, ''])
+        except Exception as e:
+            escritor.writerow([numero, nome, 'erro', '', '', str(e)])
+        finally:
+            armazem.descartar(frente_path, verso_path)
+    
+    with zipfile.ZipFile(saida, 'w', zipfile.ZIP_STORED) as zf:
+        if folhas:
+            # Entrada aberta durante todo o lote (tamanho desconhecido: ZIP64)
+            pdf = zf.open('carteirinhas.pdf', 'w', force_zip64=True)
+        
+        for numero, linha in enumerate(linhas, 1):
+            nome = 'Sem nome'
+            rg = 'Sem RG'
+            
+            try:
+                # Linha ilegível (ler_roster) ou que não é um objeto: erro só desta linha
+                if isinstance(linha, Exception):
+                    raise linha
+                if not isinstance(linha, dict):
+                    raise ValueError("A linha não é um objeto JSON")
+                
+                linha = cache_renders.normalizar_dados(linha)
+                nome = linha.get('Nome', 'Sem nome')
+                rg = linha.get('RG', 'Sem RG')
+                
+                foto_nome = None
+                foto_path = None
+                valor_foto = _valor_foto(linha)
+                
+                if valor_foto:
+                    info = fotos.get(os.path.basename(valor_foto).lower())
+                    if info is None:
+                        raise ValueError(f"Foto '{valor_foto}' não encontrada no ZIP")
+                    
+                    ext = info.filename.rsplit('.', 1)[-1].lower()
+                    with fotos_zip.open(info) as origem:
+                        foto_nome = armazem.guardar(origem, ext, db_path)
+                    foto_path = armazem.caminho(foto_nome)
+                
+                chave = cache_renders.chave_render(config, campos, area_foto, linha, foto_nome)
+                acerto = cache_renders.buscar(chave, db_path)
+                if acerto:
+                    pendentes.append((numero, nome, rg, foto_nome, None, None, None, None, chave, acerto))
+                else:
+                    frente_path = armazem.temporario('png')
+                    verso_path = None if verso_fixo else armazem.temporario('png')
+                    
+                    bloco.append((linha, frente_path, verso_path, foto_path))
+                    pendentes.append((numero, nome, rg, foto_nome, frente_path, verso_path,
+                                      (futuros_bloco, len(bloco) - 1), None, chave))
+                    if len(bloco) >= BLOCO_LOTE:
+                        enviar_bloco()
+            except Exception as e:
+                # Registrado na ordem do roster junto com as demais linhas
+                pendentes.append((numero, nome, rg, None, None, None, None, e))
+            
+            # Concluir em ordem as linhas mais antigas quando a janela enche
+            if len(pendentes) >= JANELA_LOTE:
+                enviar_bloco()
+            while len(pendentes) >= JANELA_LOTE:
+                concluir(*pendentes.popleft())
+                yield from saida.esvaziar()
+        
+        enviar_bloco()
+        while pendentes:
+            concluir(*pendentes.popleft())
+            yield from saida.esvaziar()
+        
+        if folhas:
+            pdf.write(folhas.finalizar())
+            pdf.close()
+        
+        zf.writestr('relatorio.csv', relatorio.getvalue())
+    
+    yield from saida.esvaziar()
+
+def main():
+    parser = argparse.ArgumentParser(description='Gera carteirinhas em lote a partir de um roster CSV/JSONL')
+    parser.add_argument('roster', help='Arquivo CSV ou JSON Lines com os dados')
+    parser.add_argument('fotos', nargs='?', help='ZIP com as fotos (coluna "foto" do roster)')
+    parser.add_argument('-o', '--saida', default='carteirinhas.zip', help='ZIP de saída')
+    parser.add_argument('--pdf', action='store_true', help='um PDF de impressão no lugar dos PNGs')
+    args = parser.parse_args()
+    
+    config = banco.obter_config()
+    campos = banco.listar_campos()
+    fotos_zip = zipfile.ZipFile(args.fotos) if args.fotos else None
+    
+    with open(args.roster, 'rb') as roster, open(args.saida, 'wb') as saida:
+        for bloco in gerar_lote(ler_roster(roster, args.roster), fotos_zip, config, campos,
+                                formato='pdf' if args.pdf else 'png'):
+            saida.write(bloco)
+    
+    print(f"Lote gerado em {args.saida}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,181 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+import compositor
+import fontes
+import formatos
+from psd_manager import carregar_compilado, renderizar_carteirinha
+
+# Número de processos de renderização (0 = renderizar no próprio processo)
+RENDER_WORKERS = int(os.environ.get('OAB_RENDER_WORKERS', os.cpu_count() or 1))
+
+_executor = None
+_executor_lock = threading.Lock()
+
+# Acertos/falhas do cache de máscaras de texto somados de todos os workers
+_metricas_workers = {'acertos': 0, 'falhas': 0}
+_metricas_lock = threading.Lock()
+
+def _inicializar_worker(templates):
+    """Pré-carrega os templates compilados no processo de renderização"""
+    for tipo, versao in templates:
+        try:
+            carregar_compilado(tipo, versao)
+        except Exception as e:
+            print(f"Erro ao pré-carregar template {tipo}/{versao}: {e}")
+
+def _gerar_lado(tipo, versao, dados, campos, output_path, foto_path=None, area_foto=None, tela_path=None):
+    """Executado no worker: renderiza um lado e salva em output_path (e a versão de tela em tela_path)"""
+    img = renderizar_carteirinha(tipo, versao, dados, campos, foto_path, area_foto)
+    formatos.salvar_perfil(img, output_path, 'impressao')
+    if tela_path:
+        formatos.salvar_perfil(img, tela_path, 'tela')
+    return output_path
+
+def _gerar_bloco(tipo, versao, campos, itens):
+    """Executado no worker: renderiza vários cartões de um lado em uma só tarefa.
+    
+    itens: (dados, output_path, foto_path, area_foto). Com NumPy usa o
+    compositor em lote; sem ele, o renderizador do Pillow cartão a cartão.
+    Retorna a mensagem de erro de cada item (None = ok), para que um cartão
+    com problema não derrube o bloco.
+    """
+    erros = []
+    for dados, output_path, foto_path, area_foto in itens:
+        try:
+            if compositor.NUMPY:
+                com_foto = bool(foto_path and area_foto and tipo == 'frente')
+                comp = compositor.compositor(tipo, versao, campos, com_foto)
+                with comp.lock:
+                    formatos.salvar_perfil(comp.compor(dados, foto_path, area_foto), output_path, 'impressao')
+            else:
+                _gerar_lado(tipo, versao, dados, campos, output_path, foto_path, area_foto)
+            erros.append(None)
+        except Exception as e:
+            erros.append(str(e))
+    return erros
+
+def iniciar_motor(templates=()):
+    """Cria o pool de processos (uma vez por processo web).
+    
+    templates: pares (tipo, versao) carregados na inicialização de cada worker.
+    Versões enviadas depois são carregadas sob demanda no primeiro uso.
+    """
+    global _executor
+    
+    with _executor_lock:
+        if _executor is None and RENDER_WORKERS > 0:
+            # spawn evita herdar locks de threads do processo web
+            contexto = multiprocessing.get_context('spawn')
+            _executor = ProcessPoolExecutor(max_workers=RENDER_WORKERS,
+                                            mp_context=contexto,
+                                            initializer=_inicializar_worker,
+                                            initargs=(tuple(templates),))
+        return _executor
+
+def encerrar_motor():
+    """Finaliza o pool de processos"""
+    global _executor
+    
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=True)
+            _executor = None
+
+def _descartar_executor(executor):
+    """Remove um pool quebrado (worker morto, ex.: falta de memória) para que o próximo uso crie outro"""
+    global _executor
+    
+    with _executor_lock:
+        if _executor is executor:
+            _executor = None
+    executor.shutdown(wait=False)
+
+def _executar_medindo(funcao, *args):
+    """Executado no worker: roda a função e devolve também os acertos/falhas de máscaras no período"""
+    antes = fontes.contadores_mascaras()
+    resultado = funcao(*args)
+    depois = fontes.contadores_mascaras()
+    return resultado, {chave: depois[chave] - antes[chave] for chave in depois}
+
+def _repassar(interno, futuro, executor, chamada, reenviar):
+    """Soma as métricas do worker e entrega só o resultado ao Future do chamador"""
+    try:
+        resultado, metricas = interno.result()
+    except BrokenProcessPool as e:
+        # Pool perdido: um novo pool é criado e a tarefa reenviada uma vez
+        _descartar_executor(executor)
+        if not reenviar:
+            futuro.set_exception(e)
+            return
+        try:
+            _enviar(futuro, chamada, reenviar=False)
+        except Exception as erro:
+            futuro.set_exception(erro)
+        return
+    except Exception as e:
+        futuro.set_exception(e)
+        return
+    
+    with _metricas_lock:
+        for chave, valor in metricas.items():
+            _metricas_workers[chave] += valor
+    futuro.set_result(resultado)
+
+def _enviar(futuro, chamada, reenviar=True):
+    """Envia chamada = (funcao, tipo, versao, *args) ao pool, ligando o resultado ao futuro"""
+    funcao, tipo, versao, *args = chamada
+    executor = _executor or iniciar_motor([(tipo, versao)])
+    
+    if executor is None:
+        # Sem pool: renderiza aqui mesmo e resolve o Future na hora
+        try:
+            futuro.set_result(funcao(tipo, versao, *args))
+        except Exception as e:
+            futuro.set_exception(e)
+        return
+    
+    try:
+        interno = executor.submit(_executar_medindo, *chamada)
+    except BrokenProcessPool:
+        _descartar_executor(executor)
+        if not reenviar:
+            raise
+        return _enviar(futuro, chamada, reenviar=False)
+    interno.add_done_callback(lambda interno: _repassar(interno, futuro, executor, chamada, reenviar))
+
+def _submeter(funcao, tipo, versao, *args):
+    futuro = Future()
+    _enviar(futuro, (funcao, tipo, versao) + args)
+    return futuro
+
+def submeter(tipo, versao, dados, campos, output_path, foto_path=None, area_foto=None, tela_path=None):
+    """Agenda a renderização de um lado da carteirinha e retorna um Future"""
+    return _submeter(_gerar_lado, tipo, versao, dados, campos, output_path, foto_path, area_foto, tela_path)
+
+def submeter_bloco(tipo, versao, campos, itens):
+    """Agenda um bloco de cartões de um lado (lote); o Future retorna o erro de cada item"""
+    return _submeter(_gerar_bloco, tipo, versao, campos, itens)
+
+def estatisticas_mascaras():
+    """Cache de máscaras de texto: acertos e falhas dos workers e deste processo"""
+    locais = fontes.estatisticas_mascaras()
+    with _metricas_lock:
+        acertos = _metricas_workers['acertos'] + locais['acertos']
+        falhas = _metricas_workers['falhas'] + locais['falhas']
+    return {
+        'acertos': acertos,
+        'falhas': falhas,
+        'taxa_acerto': acertos / (acertos + falhas) if acertos + falhas else 0.0,
+        'limite_bytes_por_processo': locais['limite_bytes']
+    }
+
+def aguardar(futuros, timeout=None):
+    """Aguarda uma lista de Futures e retorna seus resultados (propaga o primeiro erro)"""
+    concluidos, pendentes = wait(futuros, timeout=timeout)
+    if pendentes:
+        raise TimeoutError(f"{len(pendentes)} renderizações não terminaram a tempo")
+    return [futuro.result() for futuro in futuros]
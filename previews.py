@@ -0,0 +1,172 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image, features
+
+import formatos
+from psd_manager import carregar_compilado
+
+PASTA_PREVIEWS = os.path.join('static', 'previews')
+
+# Tamanhos máximos (largura, altura) das imagens inteiras da pirâmide
+NIVEIS = {
+    'miniatura': (320, 240),
+    'tela': (800, 600)
+}
+
+# Lado dos tiles de zoom (em pixels do nível)
+TAMANHO_TILE = int(os.environ.get('OAB_PREVIEW_TILE', '256'))
+
+# WebP quando o Pillow tiver suporte; PNG é sempre gerado como fallback
+WEBP = features.check('webp')
+FORMATO_TILES = 'webp' if WEBP else 'png'
+
+# Uma thread basta: a geração é rara (uma vez por versão de template)
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='previews')
+_agendados = set()
+_agendados_lock = threading.Lock()
+
+def pasta_previews(tipo, versao, pasta=PASTA_PREVIEWS):
+    return os.path.join(pasta, f'{tipo}_{versao}')
+
+def ler_previews(tipo, versao, pasta=PASTA_PREVIEWS):
+    """Manifesto das previews de uma versão (None se ainda não foram geradas)"""
+    if not versao:
+        return None
+    try:
+        with open(os.path.join(pasta_previews(tipo, versao, pasta), 'previews.json'), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _salvar(img, destino_sem_ext, webp=WEBP):
+    """Salva PNG (e WebP se disponível); retorna os nomes gerados"""
+    nomes = {'png': os.path.basename(destino_sem_ext) + '.png'}
+    formatos.salvar(img, destino_sem_ext + '.png', quantizar=True)
+    if webp:
+        nomes['webp'] = os.path.basename(destino_sem_ext) + '.webp'
+        img.save(destino_sem_ext + '.webp', quality=85, method=4)
+    return nomes
+
+def _niveis_zoom(largura, altura):
+    """Escalas dos níveis de zoom: resolução total e metades, enquanto maiores que a tela"""
+    tela_w, tela_h = NIVEIS['tela']
+    escalas = [1.0]
+    while largura * escalas[-1] / 2 > tela_w or altura * escalas[-1] / 2 > tela_h:
+        escalas.append(escalas[-1] / 2)
+    return escalas
+
+def gerar_previews(tipo, versao, pasta=PASTA_PREVIEWS):
+    """Gera a pirâmide de previews de um template compilado.
+    
+    Estrutura em {pasta}/{tipo}_{versao}/: miniatura e tela (PNG/WebP),
+    tiles/{z}/{x}_{y}.{formato} para cada nível de zoom e previews.json.
+    Tudo é gravado em um diretório temporário e publicado com rename,
+    então um manifesto existente sempre aponta para arquivos completos.
+    """
+    existente = ler_previews(tipo, versao, pasta)
+    if existente:
+        return existente
+    
+    base, _ = carregar_compilado(tipo, versao)
+    base = base.convert('RGB')
+    largura, altura = base.size
+    
+    os.makedirs(pasta, exist_ok=True)
+    tmp = tempfile.mkdtemp(dir=pasta, prefix=f'.{tipo}_{versao}_')
+    
+    try:
+        manifesto = {
+            'versao': versao,
+            'tipo': tipo,
+            'largura': largura,
+            'altura': altura,
+            'niveis': {},
+            'tile': TAMANHO_TILE,
+            'formato_tiles': FORMATO_TILES,
+            'zoom': []
+        }
+        
+        # Imagens inteiras: miniatura carrega primeiro, tela substitui em seguida
+        for nome, limite in NIVEIS.items():
+            img = base.copy()
+            img.thumbnail(limite, Image.Resampling.LANCZOS)
+            manifesto['niveis'][nome] = {
+                'largura': img.width,
+                'altura': img.height,
+                'escala': img.width / largura,
+                'arquivos': _salvar(img, os.path.join(tmp, nome))
+            }
+        
+        # Tiles de zoom, do nível de resolução total (z=0) para baixo
+        for z, escala in enumerate(_niveis_zoom(largura, altura)):
+            if escala == 1.0:
+                nivel = base
+            else:
+                nivel = base.resize((max(1, round(largura * escala)), max(1, round(altura * escala))),
+                                    Image.Resampling.LANCZOS)
+            
+            pasta_nivel = os.path.join(tmp, 'tiles', str(z))
+            os.makedirs(pasta_nivel)
+            
+            colunas = -(-nivel.width // TAMANHO_TILE)
+            linhas = -(-nivel.height // TAMANHO_TILE)
+            for ty in range(linhas):
+                for tx in range(colunas):
+                    caixa = (tx * TAMANHO_TILE, ty * TAMANHO_TILE,
+                             min((tx + 1) * TAMANHO_TILE, nivel.width),
+                             min((ty + 1) * TAMANHO_TILE, nivel.height))
+                    tile = nivel.crop(caixa)
+                    if FORMATO_TILES == 'webp':
+                        tile.save(os.path.join(pasta_nivel, f'{tx}_{ty}.webp'), quality=85, method=4)
+                    else:
+                        formatos.salvar(tile, os.path.join(pasta_nivel, f'{tx}_{ty}.png'), quantizar=True)
+            
+            manifesto['zoom'].append({
+                'z': z,
+                'escala': escala,
+                'largura': nivel.width,
+                'altura': nivel.height,
+                'colunas': colunas,
+                'linhas': linhas
+            })
+        
+        with open(os.path.join(tmp, 'previews.json'), 'w', encoding='utf-8') as f:
+            json.dump(manifesto, f)
+        
+        try:
+            os.rename(tmp, pasta_previews(tipo, versao, pasta))
+        except OSError:
+            # Outro processo publicou a mesma versão primeiro
+            shutil.rmtree(tmp, ignore_errors=True)
+        
+        return manifesto
+    except Exception:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+
+def _gerar_em_segundo_plano(tipo, versao, pasta):
+    try:
+        gerar_previews(tipo, versao, pasta)
+    except Exception as e:
+        print(f"Erro ao gerar previews {tipo}/{versao}: {e}")
+    finally:
+        with _agendados_lock:
+            _agendados.discard((tipo, versao, pasta))
+
+def agendar_previews(tipo, versao, pasta=PASTA_PREVIEWS):
+    """Agenda a geração das previews fora da requisição (uma vez por versão)"""
+    if not versao or ler_previews(tipo, versao, pasta):
+        return False
+    
+    with _agendados_lock:
+        if (tipo, versao, pasta) in _agendados:
+            return False
+        _agendados.add((tipo, versao, pasta))
+    
+    _executor.submit(_gerar_em_segundo_plano, tipo, versao, pasta)
+    return True
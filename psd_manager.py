@@ -1,36 +1,354 @@
-from psd_tools import PSDImage
-from PIL import Image, ImageDraw, ImageFont
+from PIL import Image, ImageDraw
+from collections import OrderedDict
 import os
 import json
-import sqlite3
+import mmap
+import hashlib
+import threading
+
+import banco
+import formatos
+from fontes import largura_texto, mascara_texto
+from fotos import foto_normalizada
+
+# psd_tools só é necessário para abrir/compilar PSDs (upload);
+# a geração usa os templates compilados e não depende dele.
+
+# Templates compilados (raster achatado + manifesto de layout)
+PASTA_COMPILADOS = os.path.join('static', 'compilados')
+
+def _info_fonte(layer):
+    """Lê família, tamanho e cor do primeiro trecho de uma camada de texto"""
+    try:
+        estilo = layer.engine_dict['StyleRun']['RunArray'][0]['StyleSheet']['StyleSheetData']
+        info = {}
+        
+        if 'FontSize' in estilo:
+            tamanho = float(estilo['FontSize'])
+            # O tamanho no PSD é relativo à transformação da camada
+            if layer.transform:
+                tamanho *= float(layer.transform[3])
+            info['tamanho'] = int(round(tamanho))
+        
+        if 'Font' in estilo:
+            fonte = layer.resource_dict['FontSet'][int(estilo['Font'])]['Name']
+            info['familia'] = str(getattr(fonte, 'value', fonte)).strip("'\x00")
+        
+        if 'FillColor' in estilo:
+            valores = [float(v) for v in estilo['FillColor']['Values']]
+            info['cor'] = [int(round(v * 255)) for v in valores[1:4]]
+        
+        return info
+    except Exception:
+        return {}
+
+def _percorrer_camadas(grupo, caminho=''):
+    """Percorre a árvore de camadas devolvendo (camada, caminho completo)"""
+    for layer in grupo:
+        caminho_layer = f"{caminho}/{layer.name}" if caminho else layer.name
+        yield layer, caminho_layer
+        if layer.is_group():
+            yield from _percorrer_camadas(layer, caminho_layer)
+
+def _camadas_do_psd(psd):
+    """Lista as camadas visíveis de um PSD já aberto.
+    
+    indice é a posição da camada em _percorrer_camadas: o caminho pode se
+    repetir (camadas com o mesmo nome no mesmo grupo).
+    """
+    camadas = []
+    
+    for indice, (layer, caminho) in enumerate(_percorrer_camadas(psd)):
+        if layer.is_visible():
+            bbox = layer.bbox
+            camada_info = {
+                'nome': layer.name,
+                'caminho': caminho,
+                'indice': indice,
+                'nivel': caminho.count('/'),
+                'tipo': layer.kind,
+                'posicao': [int(bbox[0]), int(bbox[1]), int(bbox[2]), int(bbox[3])],
+                'texto': layer.text if layer.kind == 'type' else None
+            }
+            if layer.kind == 'type':
+                camada_info['fonte'] = _info_fonte(layer)
+            camadas.append(camada_info)
+    
+    return camadas
 
 def extrair_camadas_psd(psd_path):
     """Extrai todas as camadas de um PSD"""
     try:
+        from psd_tools import PSDImage
+        
         psd = PSDImage.open(psd_path)
-        camadas = []
-        
-        for layer in psd.descendants():
-            if layer.is_visible():
-                bbox = layer.bbox
-                camada_info = {
-                    'nome': layer.name,
-                    'tipo': layer.kind,
-                    'posicao': [int(bbox[0]), int(bbox[1]), int(bbox[2]), int(bbox[3])],
-                    'texto': layer.text if layer.kind == 'type' else None
-                }
-                camadas.append(camada_info)
-        
-        return camadas
+        return _camadas_do_psd(psd)
     except Exception as e:
         print(f"Erro ao extrair camadas PSD: {e}")
         return []
 
+def hash_arquivo(caminho, bloco=1024 * 1024):
+    """Calcula o SHA-256 de um arquivo lendo em blocos"""
+    h = hashlib.sha256()
+    with open(caminho, 'rb') as f:
+        for parte in iter(lambda: f.read(bloco), b''):
+            h.update(parte)
+    return h.hexdigest()
+
+def _caminhos_compilado(tipo, versao, pasta=PASTA_COMPILADOS):
+    base = os.path.join(pasta, f'{tipo}_{versao}')
+    return base + '.json', base + '.rgbx'
+
+def _caminhos_camadas(tipo, versao, pasta=PASTA_COMPILADOS):
+    """Fundo sem as camadas dinâmicas (RGBX) e pixels dessas camadas (RGBA concatenados)"""
+    base = os.path.join(pasta, f'{tipo}_{versao}')
+    return base + '.fundo.rgbx', base + '.camadas.rgba'
+
+def _e_dinamica(camada):
+    """Camadas que o cartão pode substituir: textos (dados do membro) e o placeholder da foto"""
+    return camada['tipo'] == 'type' or 'foto' in camada['nome'].lower()
+
+def _gravar_atomico(destino, dados):
+    # Temporário por processo: workers do servidor podem compilar a mesma versão ao mesmo tempo
+    tmp = f'{destino}.{os.getpid()}.tmp'
+    with open(tmp, 'wb') as f:
+        for parte in dados:
+            f.write(parte)
+    os.replace(tmp, destino)
+
+def versao_do_hash(hash_hex):
+    """Versão do template a partir do SHA-256 do PSD"""
+    return hash_hex[:16]
+
+def _tem_composicao_parcial(manifesto):
+    """Manifesto com as camadas dinâmicas identificadas pelo índice (compilação atual)"""
+    return 'dinamicas' in manifesto and all('indice' in d for d in manifesto['dinamicas'])
+
+def _manifesto_completo(tipo, versao, pasta=PASTA_COMPILADOS):
+    """Manifesto da compilação se raster, manifesto e camadas dinâmicas estão todos em disco, senão None.
+    
+    Compilações anteriores à composição parcial (sem 'dinamicas') contam
+    como ausentes, para serem refeitas.
+    """
+    manifesto_path, raster_path = _caminhos_compilado(tipo, versao, pasta)
+    if not os.path.exists(manifesto_path) or not os.path.exists(raster_path):
+        return None
+    
+    with open(manifesto_path, encoding='utf-8') as f:
+        manifesto = json.load(f)
+    if not _tem_composicao_parcial(manifesto):
+        return None
+    if manifesto.get('fundo') and not all(os.path.exists(caminho) for caminho in _caminhos_camadas(tipo, versao, pasta)):
+        return None
+    return manifesto
+
+def template_compilado_existe(tipo, versao, pasta=PASTA_COMPILADOS):
+    return _manifesto_completo(tipo, versao, pasta) is not None
+
+def compilar_template(psd_path, tipo, pasta=PASTA_COMPILADOS, versao=None):
+    """Compila um PSD em raster achatado (RGBX bruto) + manifesto JSON de layout.
+    
+    Retorna o manifesto. A versão é derivada do conteúdo do PSD, então
+    reenviar o mesmo arquivo reaproveita a compilação existente. Se o hash
+    já foi calculado (upload em streaming), passe versao para não reler o PSD.
+    """
+    versao = versao or versao_do_hash(hash_arquivo(psd_path))
+    manifesto_path, raster_path = _caminhos_compilado(tipo, versao, pasta)
+    
+    # Compilações incompletas ou anteriores à composição parcial são refeitas (mesma versão)
+    manifesto = _manifesto_completo(tipo, versao, pasta)
+    if manifesto is not None:
+        return manifesto
+    
+    from psd_tools import PSDImage
+    
+    psd = PSDImage.open(psd_path)
+    img = psd.composite().convert("RGB")
+    camadas = _camadas_do_psd(psd)
+    
+    # Composição parcial: fundo sem as camadas dinâmicas + pixels de cada uma delas,
+    # para o render apagar só os placeholders dos campos preenchidos
+    layers = [layer for layer, _ in _percorrer_camadas(psd)]
+    dinamicas = []
+    pixels = []
+    offset = 0
+    for camada in camadas:
+        if not _e_dinamica(camada):
+            continue
+        x1, y1, x2, y2 = camada['posicao']
+        if x2 <= x1 or y2 <= y1:
+            continue
+        layer = layers[camada['indice']]
+        recorte = layer.composite(viewport=(x1, y1, x2, y2))
+        if recorte is None:
+            continue
+        dados = recorte.convert('RGBA').crop((0, 0, x2 - x1, y2 - y1)).tobytes('raw', 'RGBA')
+        dinamicas.append({'nome': camada['nome'], 'caminho': camada['caminho'], 'indice': camada['indice'],
+                          'posicao': camada['posicao'], 'foto': camada['tipo'] != 'type', 'offset': offset})
+        pixels.append(dados)
+        offset += len(dados)
+    
+    fundo_path, camadas_path = _caminhos_camadas(tipo, versao, pasta)
+    fundo = None
+    if dinamicas:
+        ocultas = {id(layers[d['indice']]) for d in dinamicas}
+        fundo = psd.composite(layer_filter=lambda layer: layer.is_visible() and id(layer) not in ocultas)
+        fundo = fundo.convert("RGB")
+    
+    # Área da foto sugerida pela camada cujo nome contém "foto"
+    area_foto = next((c['posicao'] for c in camadas
+                      if c['tipo'] != 'type' and 'foto' in c['nome'].lower()), None)
+    
+    manifesto = {
+        'versao': versao,
+        'tipo': tipo,
+        'largura': img.width,
+        'altura': img.height,
+        'modo': 'RGBX',
+        'raster': os.path.basename(raster_path),
+        'camadas': camadas,
+        'camadas_texto': [c for c in camadas if c['tipo'] == 'type'],
+        'area_foto': area_foto,
+        'dinamicas': dinamicas,
+        'fundo': os.path.basename(fundo_path) if fundo else None,
+        'raster_dinamicas': os.path.basename(camadas_path) if fundo else None
+    }
+    
+    os.makedirs(pasta, exist_ok=True)
+    
+    if fundo:
+        _gravar_atomico(fundo_path, [fundo.tobytes('raw', 'RGBX')])
+        _gravar_atomico(camadas_path, pixels)
+    
+    # Escrita em arquivo temporário + rename para não expor artefato parcial
+    _gravar_atomico(raster_path, [img.tobytes('raw', 'RGBX')])
+    _gravar_atomico(manifesto_path, [json.dumps(manifesto, ensure_ascii=False).encode('utf-8')])
+    
+    return manifesto
+
+def ler_manifesto(tipo, versao, pasta=PASTA_COMPILADOS):
+    """Lê o manifesto (índice de camadas e layout) de um template compilado"""
+    manifesto_path, _ = _caminhos_compilado(tipo, versao, pasta)
+    with open(manifesto_path, encoding='utf-8') as f:
+        return json.load(f)
+
+_compilados = {}
+_compilados_lock = threading.Lock()
+
+def carregar_compilado(tipo, versao, pasta=PASTA_COMPILADOS):
+    """Carrega um template compilado via memory-map.
+    
+    Retorna (imagem_base, manifesto). A imagem é somente leitura e
+    compartilha as páginas do arquivo com os outros workers.
+    """
+    manifesto_path, raster_path = _caminhos_compilado(tipo, versao, pasta)
+    chave = os.path.abspath(manifesto_path)
+    
+    with _compilados_lock:
+        # Compilação antiga pode ter sido refeita por outro processo: reler até ficar completa
+        if chave in _compilados and _tem_composicao_parcial(_compilados[chave][1]):
+            return _compilados[chave]
+    
+    manifesto = ler_manifesto(tipo, versao, pasta)
+    
+    with open(raster_path, 'rb') as f:
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    
+    tamanho = (manifesto['largura'], manifesto['altura'])
+    img = Image.frombuffer('RGBX', tamanho, buffer, 'raw', 'RGBX', 0, 1)
+    
+    with _compilados_lock:
+        _compilados[chave] = (img, manifesto)
+    
+    return img, manifesto
+
+# Fundos estáticos por conjunto de camadas dinâmicas (por processo)
+FUNDOS_ESTATICOS_MAX = int(os.environ.get('OAB_FUNDOS_ESTATICOS', '8'))
+
+_fundos_estaticos = OrderedDict()
+_fundos_estaticos_lock = threading.Lock()
+
+def _mmap_raster(caminho):
+    with open(caminho, 'rb') as f:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+def _intersecao(a, b):
+    caixa = (max(a[0], b[0]), max(a[1], b[1]), min(a[2], b[2]), min(a[3], b[3]))
+    return caixa if caixa[0] < caixa[2] and caixa[1] < caixa[3] else None
+
+def fundo_estatico(tipo, versao, campos_dinamicos, com_foto=False, pasta=PASTA_COMPILADOS):
+    """Base do cartão sem os placeholders das camadas que serão substituídas.
+    
+    campos_dinamicos: nomes das camadas de texto preenchidas por cartão;
+    com_foto: apaga também o placeholder da foto. O fundo é composto uma
+    vez por conjunto (só nas caixas dessas camadas, recolocando as camadas
+    estáticas que as cruzam) e fica em cache; o cartão copia e desenha só
+    a área dinâmica por cima. Retorna uma imagem compartilhada (somente leitura).
+    """
+    base, manifesto = carregar_compilado(tipo, versao, pasta)
+    # Compilação antiga (aguardando atualizar_templates): sem composição parcial
+    if not _tem_composicao_parcial(manifesto) or not manifesto.get('fundo'):
+        return base
+    dinamicas = manifesto['dinamicas']
+    removidas = [d for d in dinamicas if (d['foto'] and com_foto) or (not d['foto'] and d['nome'] in campos_dinamicos)]
+    if not removidas:
+        return base
+    
+    chave = (os.path.abspath(pasta), tipo, versao, tuple(sorted(d['indice'] for d in removidas)))
+    with _fundos_estaticos_lock:
+        img = _fundos_estaticos.get(chave)
+        if img is not None:
+            _fundos_estaticos.move_to_end(chave)
+            return img
+    
+    fundo_path, camadas_path = _caminhos_camadas(tipo, versao, pasta)
+    tamanho = (manifesto['largura'], manifesto['altura'])
+    fundo = Image.frombuffer('RGBX', tamanho, _mmap_raster(fundo_path), 'raw', 'RGBX', 0, 1)
+    pixels = memoryview(_mmap_raster(camadas_path))
+    
+    def camada(d):
+        x1, y1, x2, y2 = d['posicao']
+        inicio = d['offset']
+        return Image.frombuffer('RGBA', (x2 - x1, y2 - y1), pixels[inicio:inicio + (x2 - x1) * (y2 - y1) * 4],
+                                'raw', 'RGBA', 0, 1)
+    
+    img = base.convert('RGB')
+    for removida in removidas:
+        caixa = tuple(removida['posicao'])
+        regiao = fundo.crop(caixa).convert('RGBA')
+        
+        # Camadas que continuam estáticas e cruzam a caixa voltam por cima, na ordem do PSD
+        for d in dinamicas:
+            if d in removidas:
+                continue
+            cruzamento = _intersecao(caixa, d['posicao'])
+            if cruzamento:
+                x1, y1 = d['posicao'][:2]
+                origem = camada(d).crop((cruzamento[0] - x1, cruzamento[1] - y1,
+                                         cruzamento[2] - x1, cruzamento[3] - y1))
+                regiao.alpha_composite(origem, (cruzamento[0] - caixa[0], cruzamento[1] - caixa[1]))
+        
+        img.paste(regiao.convert('RGB'), caixa[:2])
+    
+    with _fundos_estaticos_lock:
+        _fundos_estaticos[chave] = img
+        while len(_fundos_estaticos) > FUNDOS_ESTATICOS_MAX:
+            _fundos_estaticos.popitem(last=False)
+    
+    return img
+
+def composicao_parcial(tipo, versao, pasta=PASTA_COMPILADOS):
+    """True se o template já foi compilado com as camadas dinâmicas (renders podem ir para o cache)"""
+    try:
+        return _tem_composicao_parcial(carregar_compilado(tipo, versao, pasta)[1])
+    except (OSError, ValueError):
+        return False
+
 def processar_psd_para_banco(psd_path, tipo_psd, db_path):
     """Processa um PSD e salva suas camadas no banco"""
     camadas = extrair_camadas_psd(psd_path)
     
-    conn = sqlite3.connect(db_path)
+    conn = banco.conectar(db_path)
     c = conn.cursor()
     
     # Remover camadas antigas do mesmo tipo
@@ -47,102 +365,118 @@ def processar_psd_para_banco(psd_path, tipo_psd, db_path):
             ordem += 1
     
     conn.commit()
-    conn.close()
     
     return len([c for c in camadas if c['tipo'] == 'type'])
 
-def gerar_preview_psd(psd_path, previews_dir, tamanho_max=(800, 600)):
-    """Gera uma imagem preview do PSD"""
-    try:
-        psd = PSDImage.open(psd_path)
-        img = psd.composite()
+def campos_do_cartao(manifesto, tipo, dados, campos):
+    """Campos preenchidos de um lado: (texto, origem, família, tamanho, cor), já centralizados na área"""
+    fontes_camadas = {c['nome']: c.get('fonte', {}) for c in manifesto['camadas_texto']}
+    
+    for campo in campos:
+        _, nome_original, nome_exibicao, tipo_campo, editavel, posicao = campo
+        
+        if tipo_campo != tipo or not editavel or not posicao:
+            continue
         
-        # Redimensionar se necessário
-        if img.width > tamanho_max[0] or img.height > tamanho_max[1]:
-            img.thumbnail(tamanho_max, Image.Resampling.LANCZOS)
+        valor = dados.get(nome_exibicao)
+        if not valor:
+            continue
         
-        # Salvar preview
-        preview_path = os.path.join(previews_dir, 'preview.png')
-        img.save(preview_path)
+        # Fonte, tamanho e cor da camada do PSD (quando disponíveis)
+        info = fontes_camadas.get(nome_original, {})
+        familia = info.get('familia')
+        tamanho = info.get('tamanho', 24)
+        cor = tuple(info.get('cor', (0, 0, 0)))
         
-        return preview_path
+        # Centralizar texto na área
+        x, y, x2, y2 = json.loads(posicao)
+        text_width = largura_texto(str(valor), familia, tamanho)
+        text_x = x + (x2 - x - text_width) // 2
+        text_y = y + (y2 - y - tamanho) // 2
+        
+        yield str(valor), (text_x, text_y), familia, tamanho, cor
+
+def _desenhar_tile(img, texto, origem, familia, tamanho, cor):
+    """Preenche a cor pela máscara do texto (do cache) só na caixa dele.
     
-    except Exception as e:
-        print(f"Erro ao gerar preview: {e}")
-        return None
+    É a mesma operação que draw.text faz com a máscara do FreeType, então o
+    resultado não muda; valores repetidos não são rasterizados de novo.
+    """
+    (x, y), mascara = mascara_texto(texto, origem, familia, tamanho)
+    img.paste(cor, (x, y, x + mascara.width, y + mascara.height), mascara)
 
-def gerar_carteirinha_completa(psd_path, dados, output_path, db_path, foto_path=None, area_foto=None):
-    """Gera uma carteirinha completa a partir do PSD"""
+def renderizar_carteirinha(tipo, versao, dados, campos, foto_path=None, area_foto=None):
+    """Renderiza um lado da carteirinha a partir do template compilado (sem psd_tools).
+    
+    campos: linhas da tabela campos (id, nome_original, nome_exibicao, tipo, editavel, posicao)
+    dados: valores do formulário indexados pelo nome de exibição
+    foto_path: caminho ou arquivo aberto da foto
+    
+    Cada campo (máscara do cache de textos) e a foto são colados só nas suas
+    caixas, na cópia do fundo: fora dessas áreas o cartão é só a cópia.
+    """
+    _, manifesto = carregar_compilado(tipo, versao)
+    
+    # Fundo sem os placeholders dos campos editáveis e da foto (composto uma vez por conjunto)
+    com_foto = bool(foto_path and area_foto and tipo == 'frente')
+    campos_dinamicos = frozenset(campo[1] for campo in campos if campo[3] == tipo and campo[4] and campo[5])
+    base = fundo_estatico(tipo, versao, campos_dinamicos, com_foto)
+    
+    # Única cópia do canvas neste cartão (o fundo em cache é compartilhado)
+    img = base.convert("RGB")
+    
+    for texto, origem, familia, tamanho, cor in campos_do_cartao(manifesto, tipo, dados, campos):
+        _desenhar_tile(img, texto, origem, familia, tamanho, cor)
+    
+    # Inserir foto se for a frente e tiver área definida (a foto normalizada já é o tile da área)
+    if com_foto:
+        try:
+            x1, y1, x2, y2 = area_foto
+            foto = foto_normalizada(foto_path, (x2 - x1, y2 - y1))
+            
+            img.paste(foto, (x1, y1))
+        except Exception as e:
+            print(f"Erro ao inserir foto: {e}")
+    
+    return img
+
+def verso_simulado():
+    """Verso da simulação: imagem fixa, igual para todos os membros"""
+    img = Image.new('RGB', (600, 400), color='lightgray')
+    draw = ImageDraw.Draw(img)
+    draw.text((50, 50), "Verso da Carteirinha", fill='black')
+    draw.text((50, 100), "Sistema OAB", fill='black')
+    return img
+
+def gerar_simulacao(dados, area_foto, frente_path, verso_path=None):
+    """Gera frente e verso simulados (sem template compilado; sem verso_path só a frente)"""
     try:
-        # Abrir PSD
-        psd = PSDImage.open(psd_path)
-        img = psd.composite()
+        from PIL import Image, ImageDraw
         
-        # Converter para RGB para manipulação
-        img = img.convert("RGB")
-        
-        # Criar objeto para desenho
+        # Frente com foto
+        img = Image.new('RGB', (600, 400), color='white')
         draw = ImageDraw.Draw(img)
         
-        # Tentar carregar fonte
-        try:
-            font = ImageFont.truetype("arial.ttf", 24)
-        except:
-            try:
-                font = ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf", 24)
-            except:
-                font = ImageFont.load_default()
-        
-        # Determinar tipo (frente ou verso)
-        tipo = 'frente' if 'frente' in psd_path.lower() else 'verso'
-        
-        # Obter configuração de campos do banco
-        conn = sqlite3.connect(db_path)
-        c = conn.cursor()
-        
-        c.execute("SELECT nome_original, nome_exibicao FROM campos_config WHERE tipo_psd = ? AND editavel = 1", (tipo,))
-        campos = c.fetchall()
-        
-        # Obter posições dos campos
-        c.execute("SELECT nome_original, posicao FROM campos_posicoes WHERE tipo_psd = ?", (tipo,))
-        posicoes = {row[0]: json.loads(row[1]) for row in c.fetchall()}
-        
-        conn.close()
-        
-        # Aplicar dados nos campos
-        for nome_original, nome_exibicao in campos:
-            if nome_original in dados:
-                valor = dados[nome_original]['valor']
-                
-                # Buscar posição do campo
-                if nome_original in posicoes:
-                    x, y, x2, y2 = posicoes[nome_original]
-                    # Centralizar texto na área
-                    text_width = draw.textlength(valor, font=font)
-                    text_x = x + (x2 - x - text_width) // 2
-                    text_y = y + (y2 - y - 24) // 2
-                    
-                    draw.text((text_x, text_y), str(valor), fill=(0, 0, 0), font=font)
-        
-        # Inserir foto se for a frente e tiver área definida
-        if foto_path and area_foto and tipo == 'frente':
-            try:
-                foto = Image.open(foto_path).convert("RGB")
-                
-                # Redimensionar para a área
-                x1, y1, x2, y2 = area_foto
-                foto = foto.resize((x2 - x1, y2 - y1))
-                
-                # Colar a foto
-                img.paste(foto, (x1, y1))
-            except Exception as e:
-                print(f"Erro ao inserir foto: {e}")
-        
-        # Salvar resultado
-        img.save(output_path)
-        
-        return True
+        # Adicionar texto
+        y = 50
+        for campo, valor in dados.items():
+            draw.text((50, y), f"{campo}: {valor}", fill='black')
+            y += 40
+        
+        # Adicionar área da foto
+        if area_foto:
+            area = json.loads(area_foto)
+            x1, y1, x2, y2 = area
+            draw.rectangle([x1, y1, x2, y2], outline='red', width=3)
         
+        formatos.salvar(img, frente_path)
+        
+        # Verso (simples)
+        if verso_path:
+            formatos.salvar(verso_simulado(), verso_path)
+    
     except Exception as e:
-        print(f"Erro ao gerar carteirinha: {e}")
-        return False
\ No newline at end of file
+        # Arquivos vazios em caso de erro
+        for caminho in (frente_path, verso_path):
+            if caminho:
+                open(caminho, 'w').close()
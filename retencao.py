@@ -0,0 +1,376 @@
+import argparse
+import json
+import multiprocessing
+import os
+import shutil
+import threading
+import time
+
+import armazem
+import banco
+
+# Políticas de retenção (0 = sem limite)
+RETENCAO_DIAS = int(os.environ.get('OAB_RETENCAO_DIAS', '180'))
+RETENCAO_MAX_GERACOES = int(os.environ.get('OAB_RETENCAO_MAX_GERACOES', '0'))
+RETENCAO_MAX_MB = int(os.environ.get('OAB_RETENCAO_MAX_MB', '20480'))
+
+# Arquivos sem referência só são apagados depois desse tempo (uploads aguardando a fila, temporários)
+CARENCIA_MIN = int(os.environ.get('OAB_RETENCAO_CARENCIA_MIN', '60'))
+
+# Derivadas e previews são recriáveis: saem quando ficam sem uso por esse tempo
+RETENCAO_DERIVADAS_DIAS = int(os.environ.get('OAB_RETENCAO_DERIVADAS_DIAS', '30'))
+
+# Intervalo da varredura em segundo plano (0 = desligada)
+INTERVALO_MIN = int(os.environ.get('OAB_RETENCAO_INTERVALO_MIN', '60'))
+
+# Pastas antigas com nomes por timestamp (antes do armazém)
+PASTAS_LEGADO = {'gerados': os.path.join('static', 'gerados'), 'fotos': os.path.join('static', 'fotos')}
+
+_pid = None
+_iniciar_lock = threading.Lock()
+
+def _politica(dias=None, max_geracoes=None, max_mb=None, carencia_min=None):
+    return {
+        'dias': RETENCAO_DIAS if dias is None else dias,
+        'max_geracoes': RETENCAO_MAX_GERACOES if max_geracoes is None else max_geracoes,
+        'max_bytes': (RETENCAO_MAX_MB if max_mb is None else max_mb) * 1024 * 1024,
+        'carencia_seg': (CARENCIA_MIN if carencia_min is None else carencia_min) * 60
+    }
+
+# Gerações com arquivos; alterações no banco em lotes curtos (cada um com o seu commit)
+COM_ARQUIVOS = "(foto IS NOT NULL OR frente IS NOT NULL OR verso IS NOT NULL)"
+LOTE_RETENCAO = 500
+
+def _fora_da_politica(politica):
+    """Condições SQL (e parâmetros) das gerações que perdem os arquivos por idade ou quantidade"""
+    condicoes = []
+    parametros = []
+    
+    # Idade
+    if politica['dias']:
+        condicoes.append("data < datetime('now', ?)")
+        parametros.append(f"-{politica['dias']} days")
+    
+    # Quantidade: apenas as N gerações mais recentes mantêm arquivos
+    if politica['max_geracoes']:
+        condicoes.append("id <= (SELECT id FROM historico ORDER BY id DESC LIMIT 1 OFFSET ?)")
+        parametros.append(politica['max_geracoes'])
+    
+    return condicoes, parametros
+
+def _corte_espaco(conn, politica, condicoes, parametros):
+    """Maior id a liberar para os arquivos do histórico caberem em max_bytes (None = já cabem).
+    
+    Liberando das gerações mais antigas, um objeto sai quando sai a última
+    geração que o referencia. Só conta o que o histórico referencia: o cache
+    de renders e os lados fixos têm limites próprios.
+    """
+    if not politica['max_bytes']:
+        return None
+    
+    retidas = COM_ARQUIVOS + (f" AND NOT ({' OR '.join(condicoes)})" if condicoes else "")
+    rows = conn.execute(f'''
+        SELECT MAX(r.id), COALESCE(o.tamanho, 0) FROM (
+            SELECT id, foto AS nome FROM historico WHERE {retidas}
+            UNION ALL SELECT id, frente FROM historico WHERE {retidas}
+            UNION ALL SELECT id, verso FROM historico WHERE {retidas}
+        ) r JOIN objetos o ON o.nome = r.nome
+        GROUP BY r.nome ORDER BY 1
+    ''', parametros * 3).fetchall()
+    
+    em_uso = sum(tamanho for _, tamanho in rows)
+    corte = None
+    for ultimo, tamanho in rows:
+        if em_uso <= politica['max_bytes']:
+            break
+        em_uso -= tamanho
+        corte = ultimo
+    return corte
+
+def _geracoes_a_liberar(conn, politica):
+    """Condição SQL (e parâmetros) das gerações cujos arquivos saem, ou (None, [])"""
+    condicoes, parametros = _fora_da_politica(politica)
+    corte = _corte_espaco(conn, politica, condicoes, parametros)
+    if corte is not None:
+        condicoes.append("id <= ?")
+        parametros.append(corte)
+    if not condicoes:
+        return None, []
+    return f"{COM_ARQUIVOS} AND ({' OR '.join(condicoes)})", parametros
+
+def _expirar_historico(conn, condicao, parametros, dry_run):
+    """Libera os arquivos das gerações da condição (a linha do histórico é mantida).
+    
+    Retorna quantas gerações tiveram (ou teriam, no dry_run) os arquivos liberados.
+    """
+    if condicao is None:
+        return 0
+    if dry_run:
+        return conn.execute(f"SELECT COUNT(*) FROM historico WHERE {condicao}", parametros).fetchone()[0]
+    
+    total = 0
+    while True:
+        liberadas = conn.execute(f'''
+            UPDATE historico SET foto = NULL, frente = NULL, verso = NULL
+            WHERE id IN (SELECT id FROM historico WHERE {condicao} ORDER BY id LIMIT ?)
+        ''', parametros + [LOTE_RETENCAO]).rowcount
+        conn.commit()
+        total += liberadas
+        if liberadas < LOTE_RETENCAO:
+            return total
+
+def _remover_tarefas(conn, politica, dry_run):
+    """Tarefas finalizadas antigas (o resultado continua no histórico)"""
+    antigas = "status IN ('concluido', 'falhou') AND atualizado < datetime('now', ?)"
+    parametros = [f"-{politica['dias']} days"]
+    if dry_run:
+        return conn.execute(f"SELECT COUNT(*) FROM tarefas WHERE {antigas}", parametros).fetchone()[0]
+    
+    total = 0
+    while True:
+        removidas = conn.execute(f"DELETE FROM tarefas WHERE id IN (SELECT id FROM tarefas WHERE {antigas} LIMIT ?)",
+                                 parametros + [LOTE_RETENCAO]).rowcount
+        conn.commit()
+        total += removidas
+        if removidas < LOTE_RETENCAO:
+            return total
+
+def _objetos_sem_referencia(conn, politica, condicao=None, parametros=()):
+    """Objetos do armazém sem referências, fora da carência e fora da fila.
+    
+    condicao: gerações ainda por liberar (dry_run), cujas referências já
+    são descontadas, como se tivessem sido liberadas.
+    """
+    fora_da_fila = "nome NOT IN (SELECT foto FROM tarefas WHERE foto IS NOT NULL AND status IN ('na_fila', 'executando'))"
+    carencia = f"-{politica['carencia_seg']} seconds"
+    rows = conn.execute(f'''
+        SELECT nome, tamanho FROM objetos
+        WHERE refs <= 0 AND criado < datetime('now', ?) AND {fora_da_fila}
+    ''', (carencia,)).fetchall()
+    
+    if condicao is not None:
+        rows += conn.execute(f'''
+            SELECT o.nome, o.tamanho FROM objetos o JOIN (
+                SELECT nome, COUNT(*) AS n FROM (
+                    SELECT id, foto AS nome FROM historico WHERE {condicao}
+                    UNION SELECT id, frente FROM historico WHERE {condicao}
+                    UNION SELECT id, verso FROM historico WHERE {condicao}
+                ) WHERE nome IS NOT NULL GROUP BY nome
+            ) l ON l.nome = o.nome
+            WHERE o.refs > 0 AND o.refs <= l.n AND o.criado < datetime('now', ?) AND o.{fora_da_fila}
+        ''', list(parametros) * 3 + [carencia]).fetchall()
+    return rows
+
+def _remover_objetos(conn, objetos, politica):
+    """Apaga os objetos em lotes; cada um é conferido de novo (referências e carência) no DELETE"""
+    removidos = []
+    for inicio in range(0, len(objetos), LOTE_RETENCAO):
+        for nome, tamanho in objetos[inicio:inicio + LOTE_RETENCAO]:
+            if armazem.remover_se_livre(conn, nome, politica['carencia_seg']):
+                removidos.append((nome, tamanho))
+        conn.commit()
+    return removidos
+
+def _arquivos_antigos(pasta, limite, filtro=None):
+    """Arquivos (caminho, tamanho) de uma pasta com mtime anterior a limite (não recursivo)"""
+    if not os.path.isdir(pasta):
+        return []
+    arquivos = []
+    with os.scandir(pasta) as entradas:
+        for entrada in entradas:
+            if entrada.is_file() and (filtro is None or filtro(entrada.name)):
+                st = entrada.stat()
+                if st.st_mtime < limite:
+                    arquivos.append((entrada.path, st.st_size))
+    return arquivos
+
+def _tamanho_pasta(pasta):
+    return sum(os.path.getsize(os.path.join(raiz, nome)) for raiz, _, nomes in os.walk(pasta) for nome in nomes)
+
+def _pastas_antigas(pasta, limite, manter):
+    """Subpastas (previews por versão) fora de uso e modificadas antes de limite"""
+    if not os.path.isdir(pasta):
+        return []
+    pastas = []
+    with os.scandir(pasta) as entradas:
+        for entrada in entradas:
+            if entrada.is_dir() and entrada.name not in manter and entrada.stat().st_mtime < limite:
+                pastas.append((entrada.path, _tamanho_pasta(entrada.path)))
+    return pastas
+
+def _objetos_orfaos_em_disco(conn, limite):
+    """Arquivos no armazém sem linha em objetos (processo morreu entre o rename e o commit)"""
+    orfaos = []
+    for raiz, dirs, nomes in os.walk(armazem.PASTA_ARMAZEM):
+        if os.path.abspath(raiz) == os.path.abspath(armazem.PASTA_TEMPORARIOS):
+            dirs[:] = []
+            continue
+        for nome in nomes:
+            caminho = os.path.join(raiz, nome)
+            if not armazem.e_objeto(nome) or os.path.getmtime(caminho) >= limite:
+                continue
+            if not conn.execute("SELECT 1 FROM objetos WHERE nome = ?", (nome,)).fetchone():
+                orfaos.append((caminho, os.path.getsize(caminho)))
+    return orfaos
+
+def _remover_orfaos(conn, orfaos):
+    """Apaga os órfãos com o lock de escrita, conferindo que ninguém os registrou depois da varredura"""
+    removidos = []
+    for inicio in range(0, len(orfaos), LOTE_RETENCAO):
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for caminho, tamanho in orfaos[inicio:inicio + LOTE_RETENCAO]:
+                if conn.execute("SELECT 1 FROM objetos WHERE nome = ?", (os.path.basename(caminho),)).fetchone():
+                    continue
+                try:
+                    os.remove(caminho)
+                    removidos.append((caminho, tamanho))
+                except FileNotFoundError:
+                    pass
+        finally:
+            conn.commit()
+    return removidos
+
+def varrer(dry_run=False, db_path=None, **politica):
+    """Aplica a política de retenção e retorna um relatório por categoria.
+    
+    Os candidatos em disco são levantados só com leituras; as alterações no
+    banco vêm depois, em lotes curtos, para não segurar o lock de escrita
+    durante a varredura. Com dry_run=True nada é alterado (apenas SELECTs)
+    e o relatório mostra o que uma varredura real removeria.
+    """
+    politica = _politica(**politica)
+    agora = time.time()
+    limite_carencia = agora - politica['carencia_seg']
+    limite_derivadas = agora - RETENCAO_DERIVADAS_DIAS * 86400
+    
+    conn = banco.conectar(db_path)
+    if conn.in_transaction:
+        conn.commit()
+    relatorio = {'dry_run': dry_run, 'politica': politica, 'categorias': {}}
+    remover_arquivos = []
+    remover_pastas = []
+    
+    def registrar(categoria, itens, pastas=False, removidos=False):
+        relatorio['categorias'][categoria] = {
+            'arquivos': len(itens),
+            'bytes': sum(tamanho for _, tamanho in itens),
+            'exemplos': [caminho for caminho, _ in itens[:10]]
+        }
+        if not removidos:
+            (remover_pastas if pastas else remover_arquivos).extend(caminho for caminho, _ in itens)
+    
+    try:
+        # Gerações fora da política (ainda sem alterar nada)
+        condicao, parametros = _geracoes_a_liberar(conn, politica)
+        
+        # Candidatos em disco
+        orfaos = _objetos_orfaos_em_disco(conn, limite_carencia)
+        
+        # Pastas antigas (nomes por timestamp): sai o que nenhuma geração retida ou tarefa referencia
+        retidas = COM_ARQUIVOS + (f" AND NOT ({condicao})" if condicao else "")
+        referenciados = set()
+        for row in conn.execute(f'''
+            SELECT foto, frente, verso FROM historico WHERE {retidas}
+            UNION ALL SELECT foto, frente, verso FROM tarefas
+        ''', parametros):
+            referenciados.update(nome for nome in row if nome and not armazem.e_objeto(nome))
+        for categoria, pasta in PASTAS_LEGADO.items():
+            registrar(categoria, _arquivos_antigos(pasta, limite_carencia,
+                                                   lambda nome: nome not in referenciados))
+        
+        # Derivadas recriáveis e temporários abandonados
+        from fotos import PASTA_NORMALIZADAS
+        from formatos import PASTA_DERIVADAS
+        registrar('fotos_normalizadas', _arquivos_antigos(PASTA_NORMALIZADAS, limite_derivadas))
+        registrar('derivadas', _arquivos_antigos(PASTA_DERIVADAS, limite_derivadas))
+        registrar('temporarios', _arquivos_antigos(armazem.PASTA_TEMPORARIOS, limite_carencia))
+        
+        # Previews e templates compilados de versões que não estão mais em uso
+        config = banco.obter_config(db_path)
+        versoes = {f"{tipo}_{config[f'versao_{tipo}']}" for tipo in ('frente', 'verso') if config[f'versao_{tipo}']}
+        from previews import PASTA_PREVIEWS
+        from psd_manager import PASTA_COMPILADOS
+        registrar('previews', _pastas_antigas(PASTA_PREVIEWS, limite_carencia, versoes), pastas=True)
+        registrar('compilados', _arquivos_antigos(
+            PASTA_COMPILADOS, limite_carencia,
+            lambda nome: nome.split('.')[0] not in versoes and not nome.startswith('.')))
+        
+        # Banco: lotes curtos (ou só contagens no dry_run)
+        relatorio['geracoes_liberadas'] = _expirar_historico(conn, condicao, parametros, dry_run)
+        if politica['dias']:
+            relatorio['tarefas_removidas'] = _remover_tarefas(conn, politica, dry_run)
+        
+        if dry_run:
+            objetos = _objetos_sem_referencia(conn, politica, condicao, parametros)
+        else:
+            objetos = _remover_objetos(conn, _objetos_sem_referencia(conn, politica), politica)
+            orfaos = _remover_orfaos(conn, orfaos)
+        registrar('armazem', [(armazem.caminho(nome), tamanho or 0) for nome, tamanho in objetos], removidos=True)
+        registrar('armazem_orfaos', orfaos, removidos=True)
+    except Exception:
+        conn.rollback()
+        raise
+    
+    if dry_run:
+        return relatorio
+    
+    for caminho in remover_arquivos:
+        try:
+            os.remove(caminho)
+        except OSError as e:
+            print(f"Erro ao remover {caminho}: {e}")
+    for caminho in remover_pastas:
+        shutil.rmtree(caminho, ignore_errors=True)
+    
+    return relatorio
+
+def _reservar_varredura(db_path):
+    """Só um processo (worker do servidor) varre por intervalo: reserva atômica no banco"""
+    agora = int(time.time())
+    with banco.conectar(db_path) as conn:
+        conn.execute("INSERT OR IGNORE INTO contadores (nome, valor) VALUES ('retencao_varredura', 0)")
+        # Folga de 1 minuto para o atraso entre as threads dos processos
+        return conn.execute("UPDATE contadores SET valor = ? WHERE nome = 'retencao_varredura' AND valor <= ?",
+                            (agora, agora - INTERVALO_MIN * 60 + 60)).rowcount == 1
+
+def _varredor(db_path):
+    """Thread da varredura periódica"""
+    while True:
+        time.sleep(INTERVALO_MIN * 60)
+        try:
+            if not _reservar_varredura(db_path):
+                continue
+            relatorio = varrer(db_path=db_path)
+            removidos = sum(c['arquivos'] for c in relatorio['categorias'].values())
+            if removidos:
+                print(f"Retenção: {removidos} arquivos removidos")
+        except Exception as e:
+            print(f"Erro na varredura de retenção: {e}")
+
+def iniciar(db_path):
+    """Inicia a varredura em segundo plano neste processo (idempotente)"""
+    global _pid
+    
+    if INTERVALO_MIN <= 0 or multiprocessing.parent_process() is not None:
+        return
+    
+    with _iniciar_lock:
+        if _pid == os.getpid():
+            return
+        _pid = os.getpid()
+        threading.Thread(target=_varredor, args=(db_path,), name='retencao', daemon=True).start()
+
+def main():
+    parser = argparse.ArgumentParser(description='Aplica a política de retenção de arquivos gerados')
+    parser.add_argument('--dry-run', action='store_true', help='apenas mostra o que seria removido')
+    parser.add_argument('--dias', type=int, help='idade máxima das gerações com arquivos')
+    parser.add_argument('--max-geracoes', type=int, help='quantidade de gerações recentes com arquivos')
+    parser.add_argument('--max-mb', type=int, help='espaço máximo do armazém')
+    args = parser.parse_args()
+    
+    relatorio = varrer(dry_run=args.dry_run, dias=args.dias, max_geracoes=args.max_geracoes, max_mb=args.max_mb)
+    print(json.dumps(relatorio, indent=2, ensure_ascii=False))
+
+if __name__ == '__main__':
+    main()
@@ -7,9 +7,33 @@ class AreaSelecao {
         this.coordenadas = { x1: 0, y1: 0, x2: 0, y2: 0 };
         this.cliqueAtual = 0;
         
+        // Coordenadas ficam no espaço da preview de tela, independente do zoom do navegador
+        this.espaco = {
+            largura: parseInt(this.container.dataset.espacoLargura) || this.imagem.naturalWidth,
+            altura: parseInt(this.container.dataset.espacoAltura) || this.imagem.naturalHeight
+        };
+        
         this.inicializar();
     }
     
+    escalaExibicao() {
+        // Pixels exibidos por pixel do espaço da preview
+        const rect = this.imagem.getBoundingClientRect();
+        return {
+            x: rect.width / this.espaco.largura,
+            y: rect.height / this.espaco.altura
+        };
+    }
+    
+    desenharArea() {
+        const escala = this.escalaExibicao();
+        this.area.style.left = (this.coordenadas.x1 * escala.x) + 'px';
+        this.area.style.top = (this.coordenadas.y1 * escala.y) + 'px';
+        this.area.style.width = ((this.coordenadas.x2 - this.coordenadas.x1) * escala.x) + 'px';
+        this.area.style.height = ((this.coordenadas.y2 - this.coordenadas.y1) * escala.y) + 'px';
+        this.area.style.display = 'block';
+    }
+    
     inicializar() {
         // Eventos do mouse
         this.imagem.addEventListener('click', this.clicar.bind(this));
@@ -18,21 +42,29 @@ class AreaSelecao {
         document.getElementById('btn-limpar')?.addEventListener('click', () => this.limpar());
         document.getElementById('btn-salvar-area')?.addEventListener('click', () => this.salvar());
         
+        // Redesenhar a seleção quando a imagem mudar de tamanho na tela
+        window.addEventListener('resize', () => {
+            if (this.cliqueAtual === 0 && this.area.style.display === 'block') this.desenharArea();
+        });
+        
         // Carregar área existente
         this.carregarAreaExistente();
     }
     
     clicar(event) {
         const rect = this.imagem.getBoundingClientRect();
-        const x = event.clientX - rect.left;
-        const y = event.clientY - rect.top;
+        const escala = this.escalaExibicao();
+        const x = Math.round((event.clientX - rect.left) / escala.x);
+        const y = Math.round((event.clientY - rect.top) / escala.y);
         
         if (this.cliqueAtual === 0) {
             // Primeiro clique
             this.coordenadas.x1 = Math.round(x);
             this.coordenadas.y1 = Math.round(y);
-            this.area.style.left = x + 'px';
-            this.area.style.top = y + 'px';
+            this.area.style.left = (x * escala.x) + 'px';
+            this.area.style.top = (y * escala.y) + 'px';
+            this.area.style.width = '0';
+            this.area.style.height = '0';
             this.area.style.display = 'block';
             this.cliqueAtual = 1;
             
@@ -50,11 +82,7 @@ class AreaSelecao {
                 [this.coordenadas.y1, this.coordenadas.y2] = [this.coordenadas.y2, this.coordenadas.y1];
             }
             
-            const width = this.coordenadas.x2 - this.coordenadas.x1;
-            const height = this.coordenadas.y2 - this.coordenadas.y1;
-            
-            this.area.style.width = width + 'px';
-            this.area.style.height = height + 'px';
+            this.desenharArea();
             this.cliqueAtual = 0;
             
             this.atualizarStatus(`✅ Área selecionada! Clique em "Salvar Área" para confirmar.`);
@@ -70,13 +98,16 @@ class AreaSelecao {
         if (areaSalva && areaSalva.value) {
             try {
                 const area = JSON.parse(areaSalva.value);
-                this.coordenadas = { x1: area[0], y1: area[1], x2: area[2], y2: area[3] };
                 
-                this.area.style.left = area[0] + 'px';
-                this.area.style.top = area[1] + 'px';
-                this.area.style.width = (area[2] - area[0]) + 'px';
-                this.area.style.height = (area[3] - area[1]) + 'px';
-                this.area.style.display = 'block';
+                // Área salva em outro espaço (PSD reenviado): converter para o atual
+                const fx = areaSalva.dataset.largura ? this.espaco.largura / parseInt(areaSalva.dataset.largura) : 1;
+                const fy = areaSalva.dataset.altura ? this.espaco.altura / parseInt(areaSalva.dataset.altura) : 1;
+                this.coordenadas = {
+                    x1: Math.round(area[0] * fx), y1: Math.round(area[1] * fy),
+                    x2: Math.round(area[2] * fx), y2: Math.round(area[3] * fy)
+                };
+                
+                this.desenharArea();
                 
                 this.mostrarCoordenadas();
                 this.atualizarStatus('✅ Área carregada do banco de dados');
@@ -143,7 +174,7 @@ class AreaSelecao {
             headers: {
                 'Content-Type': 'application/json'
             },
-            body: JSON.stringify(this.coordenadas)
+            body: JSON.stringify({ ...this.coordenadas, largura: this.espaco.largura, altura: this.espaco.altura })
         })
         .then(response => response.json())
         .then(data => {
@@ -161,11 +192,125 @@ class AreaSelecao {
     }
 }
 
+// Preview progressiva: miniatura -> tela, e lupa com tiles de zoom sob demanda
+class PreviewPiramide {
+    constructor(containerId, imagemId, lupaId) {
+        this.container = document.getElementById(containerId);
+        this.imagem = document.getElementById(imagemId);
+        this.lupa = document.getElementById(lupaId);
+        this.contexto = this.lupa ? this.lupa.getContext('2d') : null;
+        
+        this.base = this.container.dataset.base;
+        this.largura = parseInt(this.container.dataset.largura);
+        this.altura = parseInt(this.container.dataset.altura);
+        this.tile = parseInt(this.container.dataset.tile);
+        this.formato = this.container.dataset.formatoTiles;
+        this.tiles = new Map();
+        this.ultimoPonto = null;
+        
+        this.carregarTela();
+        
+        if (this.lupa) {
+            this.imagem.addEventListener('mousemove', this.moverLupa.bind(this));
+            this.imagem.addEventListener('mouseleave', () => { this.lupa.style.display = 'none'; });
+        }
+    }
+    
+    carregarTela() {
+        // Pré-carrega a imagem de tela e só então troca (sem piscar)
+        const fonte = this.container.querySelector('source[data-tela]');
+        const urlTela = this.imagem.dataset.tela;
+        const img = new Image();
+        img.onload = () => {
+            if (fonte) fonte.srcset = fonte.dataset.tela;
+            this.imagem.src = urlTela;
+        };
+        img.src = urlTela;
+    }
+    
+    carregarTile(tx, ty) {
+        // Tiles de resolução total (nível 0), baixados uma única vez
+        const chave = `${tx}_${ty}`;
+        if (!this.tiles.has(chave)) {
+            const img = new Image();
+            img.onload = () => this.desenharLupa();
+            img.src = `${this.base}/tiles/0/${chave}.${this.formato}`;
+            this.tiles.set(chave, img);
+        }
+        return this.tiles.get(chave);
+    }
+    
+    moverLupa(event) {
+        const rect = this.imagem.getBoundingClientRect();
+        const x = event.clientX - rect.left;
+        const y = event.clientY - rect.top;
+        
+        // Ponto correspondente no template em resolução total
+        this.ultimoPonto = {
+            x: x * this.largura / rect.width,
+            y: y * this.altura / rect.height
+        };
+        
+        this.lupa.style.left = (x + 20) + 'px';
+        this.lupa.style.top = (y + 20) + 'px';
+        this.lupa.style.display = 'block';
+        this.desenharLupa();
+    }
+    
+    desenharLupa() {
+        if (!this.ultimoPonto) return;
+        
+        const lado = this.lupa.width;
+        const x0 = this.ultimoPonto.x - lado / 2;
+        const y0 = this.ultimoPonto.y - lado / 2;
+        
+        this.contexto.fillStyle = '#fff';
+        this.contexto.fillRect(0, 0, lado, lado);
+        
+        // Apenas os tiles que cobrem a janela da lupa
+        const colunas = Math.ceil(this.largura / this.tile);
+        const linhas = Math.ceil(this.altura / this.tile);
+        for (let ty = Math.max(0, Math.floor(y0 / this.tile)); ty <= Math.min(linhas - 1, Math.floor((y0 + lado) / this.tile)); ty++) {
+            for (let tx = Math.max(0, Math.floor(x0 / this.tile)); tx <= Math.min(colunas - 1, Math.floor((x0 + lado) / this.tile)); tx++) {
+                const img = this.carregarTile(tx, ty);
+                if (img.complete && img.naturalWidth) {
+                    this.contexto.drawImage(img, tx * this.tile - x0, ty * this.tile - y0);
+                }
+            }
+        }
+        
+        // Mira no centro
+        this.contexto.strokeStyle = 'red';
+        this.contexto.beginPath();
+        this.contexto.moveTo(lado / 2, 0);
+        this.contexto.lineTo(lado / 2, lado);
+        this.contexto.moveTo(0, lado / 2);
+        this.contexto.lineTo(lado, lado / 2);
+        this.contexto.stroke();
+    }
+}
+
 // Gerenciamento de campos
 document.addEventListener('DOMContentLoaded', function() {
     // Inicializar seletor de área
     if (document.getElementById('preview-imagem')) {
         window.seletor = new AreaSelecao('preview-container', 'preview-imagem');
+        window.piramide = new PreviewPiramide('preview-container', 'preview-imagem', 'zoom-lupa');
+    }
+    
+    // Aguardar a geração das previews em segundo plano
+    const gerando = document.getElementById('preview-gerando');
+    if (gerando) {
+        const verificar = setInterval(() => {
+            fetch(`/api/previews/${gerando.dataset.tipo}`)
+                .then(response => response.json())
+                .then(data => {
+                    if (data.pronto) {
+                        clearInterval(verificar);
+                        location.reload();
+                    }
+                });
+        }, 2000);
     }
     
     // Atualizar campos editáveis
@@ -0,0 +1,62 @@
+import hashlib
+import os
+import tempfile
+
+from flask import Request
+
+# Pasta final dos PSDs (o temporário fica nela para o rename ser atômico)
+PASTA_PSD = os.path.join('static', 'psd_base')
+
+# Rotas cujos arquivos são gravados direto em disco com hash incremental
+ROTAS_STREAMING = {'/upload_psd': PASTA_PSD}
+
+class ArquivoComHash:
+    """Arquivo temporário que calcula o SHA-256 enquanto recebe os blocos.
+    
+    O conteúdo nunca fica inteiro em memória: cada bloco do multipart é
+    escrito no disco e somado ao hash. Se não for movido com mover_para(),
+    o temporário é apagado ao fechar.
+    """
+    
+    def __init__(self, pasta):
+        os.makedirs(pasta, exist_ok=True)
+        fd, self.caminho = tempfile.mkstemp(dir=pasta, prefix='.upload_', suffix='.tmp')
+        self._arquivo = os.fdopen(fd, 'w+b')
+        self._hash = hashlib.sha256()
+        self.tamanho = 0
+        self.movido = False
+    
+    def write(self, dados):
+        self._hash.update(dados)
+        self.tamanho += len(dados)
+        return self._arquivo.write(dados)
+    
+    def hexdigest(self):
+        return self._hash.hexdigest()
+    
+    def mover_para(self, destino):
+        """Fecha o temporário e o renomeia atomicamente para destino"""
+        self._arquivo.flush()
+        os.fsync(self._arquivo.fileno())
+        self._arquivo.close()
+        os.replace(self.caminho, destino)
+        self.movido = True
+    
+    def close(self):
+        if not self._arquivo.closed:
+            self._arquivo.close()
+        if not self.movido and os.path.exists(self.caminho):
+            os.remove(self.caminho)
+    
+    def __getattr__(self, nome):
+        # read/seek/tell/etc. do arquivo real (usados pelo FileStorage)
+        return getattr(self._arquivo, nome)
+
+class RequestUpload(Request):
+    """Request que grava uploads das rotas de streaming direto no destino"""
+    
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        pasta = ROTAS_STREAMING.get(self.path)
+        if pasta:
+            return ArquivoComHash(pasta)
+        return super()._get_file_stream(total_content_length, content_type, filename, content_length)